@@ -0,0 +1,211 @@
+"""
+Benchmark the Mint sensor update pipeline.
+
+Runs a MintClient on the fake backend against synthetic account sets and
+times every update cycle: the client refresh (fetch, normalize, convert and
+aggregate), then MintNetWorthSensor.async_update and every
+MintCategorySensor.async_update. A second, traced pass of each scenario
+records allocations and peak memory with tracemalloc, so tracing does not
+skew the timings.
+
+Results are written as JSON, keyed by scenario, so runs from two commits
+can be compared:
+
+    python benchmarks/bench_update.py --output before.json
+    git checkout other-branch
+    python benchmarks/bench_update.py --output after.json --compare before.json
+
+Needs Home Assistant and the integration's requirements installed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.mint_finance import sensor  # noqa: E402
+from custom_components.mint_finance.backend import BACKEND_FAKE  # noqa: E402
+from custom_components.mint_finance.currency import RATES_CACHE, get_currency_rates  # noqa: E402
+from custom_components.mint_finance.fake import FakeBackend, generate_accounts  # noqa: E402
+
+SIZES = [10, 1000, 100000]
+# Share of accounts given a currency override in the override scenarios
+OVERRIDE_RATIO = 0.1
+OVERRIDE_CURRENCIES = ['EUR', 'GBP', 'JPY']
+
+
+def scenario_config(accounts, overrides):
+    config = {
+        sensor.CONF_USERNAME: 'benchmark',
+        sensor.CONF_PASSWORD: 'benchmark',
+        sensor.CONF_UNIT_OF_MEASUREMENT: 'USD',
+        sensor.CONF_CATEGORIES: [],
+        sensor.CONF_BACKEND: BACKEND_FAKE,
+        # build_scenario swaps in a seeded backend serving `accounts`
+        sensor.CONF_FAKE_ACCOUNTS: 0,
+    }
+    if overrides:
+        step = int(1 / OVERRIDE_RATIO)
+        by_currency = dict((currency, []) for currency in OVERRIDE_CURRENCIES)
+        for index, account in enumerate(accounts[::step]):
+            by_currency[OVERRIDE_CURRENCIES[index % len(OVERRIDE_CURRENCIES)]].append(account['id'])
+        config[sensor.CONF_ACCOUNT_CURRENCY_OVERRIDE] = [by_currency]
+    return config
+
+
+def build_scenario(size, overrides, volatility, seed):
+    """Return (client, networth sensor, category sensors) serving `size` fake accounts."""
+    accounts = generate_accounts(size, seed=seed)
+    config = scenario_config(accounts, overrides)
+    client = sensor.MintClient(config)
+    client.backends = [FakeBackend(accounts, volatility=volatility, seed=seed)]
+    hass = SimpleNamespace(data={})
+    networth = sensor.MintNetWorthSensor(client, config)
+    categories = [sensor.MintCategorySensor(hass, client, config, sensor_type)
+                  for sensor_type in sensor.SENSOR_TYPES]
+    return client, networth, categories
+
+
+def run_cycle(loop, client, networth, categories):
+    """Run one update cycle and return the seconds each stage took."""
+    started = time.perf_counter()
+    # Force a fetch, as a new scheduler cycle would
+    client._last_attempt = None
+    client._published_snapshot = client.get_snapshot()
+    refreshed = time.perf_counter()
+    loop.run_until_complete(networth.async_update())
+    networth_done = time.perf_counter()
+    for category in categories:
+        loop.run_until_complete(category.async_update())
+    finished = time.perf_counter()
+    return {
+        'refresh': refreshed - started,
+        'networth_update': networth_done - refreshed,
+        'category_update': finished - networth_done,
+        'total': finished - started,
+    }
+
+
+def summarize(samples):
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'max': max(samples),
+    }
+
+
+def bench_scenario(loop, size, overrides, iterations, volatility, seed):
+    client, networth, categories = build_scenario(size, overrides, volatility, seed)
+    try:
+        # Warm up: loads currency rates and fills the aggregation reuse state
+        run_cycle(loop, client, networth, categories)
+        cycles = [run_cycle(loop, client, networth, categories) for _ in range(iterations)]
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            run_cycle(loop, client, networth, categories)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        client.close()
+        client._executor.shutdown(wait=False)
+
+    return {
+        'accounts': size,
+        'currency_overrides': overrides,
+        'iterations': iterations,
+        'seconds': dict((stage, summarize([cycle[stage] for cycle in cycles])) for stage in cycles[0]),
+        'retained_bytes': after - before,
+        'peak_bytes': peak - before,
+    }
+
+
+def scenario_key(result):
+    return '{}{}'.format(result['accounts'], '-overrides' if result['currency_overrides'] else '')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    print('{:<22}{:>14}{:>14}{:>9}'.format('scenario', 'before (ms)', 'after (ms)', 'ratio'))
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        before = baseline[key]['seconds']['total']['median'] * 1000
+        after = result['seconds']['total']['median'] * 1000
+        print('{:<22}{:>14.2f}{:>14.2f}{:>9.2f}'.format(key, before, after, after / before if before else 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='cycles per scenario; default scales down with the account count')
+    parser.add_argument('--volatility', type=float, default=0.001,
+                        help='fraction balances move per fetch; 0 measures unchanged snapshots')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='print median totals against an earlier results file')
+    args = parser.parse_args(argv)
+
+    rates_dir = tempfile.mkdtemp(prefix='mint-bench-')
+    # Use the bundled rates so runs are offline and comparable
+    get_currency_rates(os.path.join(rates_dir, RATES_CACHE), download=False)
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for size in args.sizes:
+            iterations = args.iterations or max(3, min(50, 100000 // size))
+            for overrides in (False, True):
+                result = bench_scenario(loop, size, overrides, iterations, args.volatility, args.seed)
+                results[scenario_key(result)] = result
+                print('{:<22} median {:9.2f} ms  peak {:10.1f} KiB'.format(
+                    scenario_key(result), result['seconds']['total']['median'] * 1000,
+                    result['peak_bytes'] / 1024), file=sys.stderr)
+    finally:
+        loop.close()
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'volatility': args.volatility,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
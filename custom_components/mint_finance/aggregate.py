@@ -0,0 +1,133 @@
+"""
+Net worth, asset, liability and per-category totals of the Mint accounts.
+
+Plain functions over normalized MintAccount records; nothing here needs
+Home Assistant.
+"""
+
+import logging
+from collections import namedtuple
+
+from .metrics import COUNTER_CATEGORY_REUSES, NULL_METRICS, STAGE_CONVERT
+
+_LOGGER = logging.getLogger(__name__)
+
+# Mint account types
+ATTR_INVESTMENT = 'investment'
+ATTR_MORTGAGE = 'mortgage'
+ATTR_CASH = 'bank'
+ATTR_OTHER_ASSET = 'other property'
+ATTR_CREDIT = 'credit'
+ATTR_LOAN = 'loan'
+ATTR_REAL_ESTATE = 'real estate'
+ATTR_VEHICLE = 'vehicle'
+ATTR_UNCLASSIFIED = 'unclassified'
+
+SENSOR_TYPES = {
+    ATTR_INVESTMENT: ['INVESTMENT', 'Investment', False],
+    ATTR_MORTGAGE: ['MORTGAGE', 'Mortgage', True],
+    ATTR_CASH: ['BANK', 'Cash', False],
+    ATTR_OTHER_ASSET: ['OTHER_ASSETS', 'Other Asset', False],
+    ATTR_CREDIT: ['CREDIT_CARD', 'Credit', True],
+    ATTR_LOAN: ['LOAN', 'Loan', True],
+    ATTR_VEHICLE: ['VEHICLE', 'Vehicle', False],
+    ATTR_REAL_ESTATE: ['REAL_ESTATE', 'Real Estate', False],
+}
+
+ASSET_ACCOUNT_TYPES = [ATTR_INVESTMENT, ATTR_CASH, ATTR_OTHER_ASSET, ATTR_VEHICLE, ATTR_REAL_ESTATE]
+LIABILITY_ACCOUNT_TYPES = [ATTR_MORTGAGE, ATTR_CREDIT, ATTR_LOAN]
+
+
+AccountTotals = namedtuple('AccountTotals', ['networth', 'assets', 'liabilities', 'categories'])
+CategoryTotals = namedtuple('CategoryTotals', ['total', 'accounts', 'balance', 'fingerprint'])
+
+
+def format_balance(inverse_sign, balance):
+    return -1.0 * balance if inverse_sign is True else balance
+
+
+def aggregate_accounts(accounts, unit_of_measurement, currency_overrides=None, converter=None,
+                       excluded_accounts=frozenset(), previous=None, metrics=NULL_METRICS):
+    """Group the accounts in one pass and total net worth, assets, liabilities and every category.
+
+    Takes normalized MintAccount records. Balances are sign-formatted by
+    account type and converted to unit_of_measurement where an override
+    applies; only derived values are produced. Accounts in
+    excluded_accounts are skipped before any of that happens.
+
+    Categories whose fingerprint matches the one in `previous` reuse its
+    CategoryTotals object as is, so callers can detect changes by identity.
+    The balances of the other categories are converted in a single pass,
+    timed as the convert stage.
+    """
+    groups = {}
+    for account in accounts:
+        if not account.is_open or account.id in excluded_accounts:
+            continue
+        groups.setdefault(account.accountType, []).append(account)
+
+    # A category's fingerprint is its accounts plus the rates day used to
+    # convert them; the records compare by value, so a match means nothing changed.
+    rates_date = getattr(converter, 'date', None) if currency_overrides else None
+    previous_categories = previous.categories if previous is not None else {}
+
+    categories = {}
+    changed = []
+    for account_type in set(SENSOR_TYPES).union(groups):
+        group = tuple(groups.get(account_type, ()))
+        fingerprint = (group, rates_date)
+        cached = previous_categories.get(account_type)
+        if cached is not None and cached.fingerprint == fingerprint:
+            categories[account_type] = cached
+            metrics.increment(COUNTER_CATEGORY_REUSES)
+        else:
+            changed.append((account_type, group, fingerprint))
+
+    with metrics.timer(STAGE_CONVERT):
+        balances = [
+            _category_balances(account_type, group, unit_of_measurement, currency_overrides, converter)
+            for account_type, group, _ in changed]
+    for (account_type, group, fingerprint), group_balances in zip(changed, balances):
+        categories[account_type] = _total_category(account_type, group, group_balances, fingerprint)
+
+    networth = sum(category.balance for category in categories.values())
+    assets = sum(categories[account_type].balance for account_type in ASSET_ACCOUNT_TYPES)
+    liabilities = sum(categories[account_type].balance for account_type in LIABILITY_ACCOUNT_TYPES)
+    return AccountTotals(round(networth), round(assets), round(liabilities), categories)
+
+
+def _category_balances(account_type, accounts, unit_of_measurement, currency_overrides, converter):
+    """Return the accounts' balances, sign-formatted and converted where an override applies."""
+    sensor_type = SENSOR_TYPES.get(account_type)
+    inverse_sign = sensor_type is not None and sensor_type[2]
+    balances = [format_balance(inverse_sign, account.currentBalance) for account in accounts]
+    if currency_overrides:
+        for index, account in enumerate(accounts):
+            currency = currency_overrides.get(account.id)
+            if currency is not None:
+                try:
+                    balances[index] = round(converter.convert(balances[index], currency, unit_of_measurement))
+                except ValueError as exp:
+                    # One bad currency code must not stop every refresh
+                    _LOGGER.warning('Not converting account %s: %s', account.id, exp)
+    return balances
+
+
+def _total_category(account_type, accounts, balances, fingerprint):
+    balance_sum = 0
+    rows = []
+    for account, balance in zip(accounts, balances):
+        balance_sum += balance
+        rows.append({
+            "name": account.accountName,
+            "id": account.id,
+            "firm_name": account.fiName,
+            # "logo": account.get('logoPath', ''),
+            "balance": balance,
+            "account_type": account_type,
+            # "url": account.get('homeUrl', ''),
+            "currency": account.currency,
+            "refreshed": account.lastUpdatedInDate,
+            # "refreshed": how_long_ago(account.get('lastUpdatedInDate', 0)) + ' ago',
+        })
+    return CategoryTotals(round(balance_sum), tuple(rows), balance_sum, fingerprint)
@@ -0,0 +1,118 @@
+"""
+Trend metrics over the balance history.
+
+Everything is computed with whole-array NumPy operations on the history
+columns, so refreshing every series each cycle stays cheap even with years
+of per-account rows. The steps are:
+
+1. Turn each row into a delta against the previous balance of the same
+   account (a stable sort by account, a diff, and a scatter back).
+2. A cumulative sum of the deltas in time order gives the running total
+   after every row.
+3. The last running total of each day, forward filled over days without
+   rows, gives one value per calendar day.
+"""
+
+from collections import namedtuple
+
+from .lazy import numpy
+
+DAY = 24 * 60 * 60
+
+METRIC_DAY_CHANGE = 'day_change'
+METRIC_MONTH_CHANGE = 'month_change'
+METRIC_AVERAGE_30 = 'average_30d'
+METRIC_AVERAGE_90 = 'average_90d'
+METRIC_MAX_DRAWDOWN = 'max_drawdown'
+
+METRICS = {
+    METRIC_DAY_CHANGE: 'Change 1d',
+    METRIC_MONTH_CHANGE: 'Change 30d',
+    METRIC_AVERAGE_30: 'Average 30d',
+    METRIC_AVERAGE_90: 'Average 90d',
+    METRIC_MAX_DRAWDOWN: 'Max Drawdown',
+}
+
+TrendMetrics = namedtuple('TrendMetrics', sorted(METRICS))
+
+
+def daily_series(timestamps, accounts, balances, account_ids=None, utc_offset=0, until=None):
+    """Return (days, values): the summed balance of the accounts at the end of every day.
+
+    `days` is a contiguous range of day numbers since the epoch, shifted by
+    utc_offset seconds so days follow local midnight. It runs up to the day
+    of the `until` timestamp when that is later than the last row.
+    """
+    np = numpy.load()
+
+    timestamps = np.frombuffer(timestamps, dtype=np.float64)
+    accounts = np.frombuffer(accounts, dtype=np.int64)
+    balances = np.frombuffer(balances, dtype=np.float64)
+
+    if account_ids is not None:
+        mask = np.isin(accounts, np.fromiter(account_ids, dtype=np.int64))
+        timestamps, accounts, balances = timestamps[mask], accounts[mask], balances[mask]
+    if not len(timestamps):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    # Rows are in time order; a stable sort by account keeps each account's
+    # rows in time order too.
+    order = np.argsort(accounts, kind='stable')
+    sorted_accounts = accounts[order]
+    sorted_balances = balances[order]
+    first = np.empty(len(order), dtype=bool)
+    first[0] = True
+    np.not_equal(sorted_accounts[1:], sorted_accounts[:-1], out=first[1:])
+    previous = np.empty_like(sorted_balances)
+    previous[0] = 0.0
+    previous[1:] = sorted_balances[:-1]
+    previous[first] = 0.0
+
+    deltas = np.empty_like(balances)
+    deltas[order] = sorted_balances - previous
+    running = np.cumsum(deltas)
+
+    row_days = ((timestamps + utc_offset) // DAY).astype(np.int64)
+    day_ends = np.flatnonzero(np.append(row_days[1:] != row_days[:-1], True))
+    known_days = row_days[day_ends]
+    known_values = running[day_ends]
+
+    last_day = known_days[-1]
+    if until is not None:
+        last_day = max(last_day, int((until + utc_offset) // DAY))
+    days = np.arange(known_days[0], last_day + 1, dtype=np.int64)
+    filled = np.searchsorted(known_days, days, side='right') - 1
+    return days, known_values[filled]
+
+
+def trend_metrics(values):
+    """Compute every METRICS entry for a daily series; None where there is not enough data."""
+    np = numpy.load()
+
+    if not len(values):
+        return TrendMetrics(**dict((metric, None) for metric in METRICS))
+
+    def change(days):
+        if len(values) <= days:
+            return None
+        return round(float(values[-1] - values[-1 - days]), 2)
+
+    peaks = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, (peaks - values) / peaks, 0.0)
+
+    return TrendMetrics(**{
+        METRIC_DAY_CHANGE: change(1),
+        METRIC_MONTH_CHANGE: change(30),
+        METRIC_AVERAGE_30: round(float(values[-30:].mean()), 2),
+        METRIC_AVERAGE_90: round(float(values[-90:].mean()), 2),
+        METRIC_MAX_DRAWDOWN: round(float(drawdowns.max()) * 100, 2),
+    })
+
+
+def compute_trends(history, series, now, utc_offset=0):
+    """Return {series key: TrendMetrics} for {series key: account ids or None for all}."""
+    timestamps, accounts, balances = history.columns()
+    return dict(
+        (key, trend_metrics(daily_series(timestamps, accounts, balances, account_ids, utc_offset, now)[1]))
+        for key, account_ids in series.items())
@@ -0,0 +1,383 @@
+"""
+Mint data backends.
+
+MintClient talks to Mint through a MintBackend, so how the data is fetched
+can be swapped without touching the snapshot, retry or sensor code.
+
+SeleniumBackend drives mintapi's Chrome session for every call, exactly as
+before. HttpBackend only uses the browser to log in: it copies the session
+cookies and API token into a pooled requests session, closes the browser
+and then makes the same JSON calls mintapi makes, over plain HTTP. Its
+base_url can point at a local stand-in server for testing. FakeBackend in
+fake.py serves synthetic accounts without Mint at all. RemoteBackend in
+worker.py forwards every call to a backend running in a separate process.
+
+build_backend() makes a login's backend from a plain, JSON friendly spec,
+so Home Assistant and the out-of-process worker build them the same way.
+"""
+
+import json
+import logging
+import random
+from datetime import date, datetime
+from urllib.parse import urlencode
+
+from .lazy import mintapi_api, requests, requests_adapters, selenium_exceptions
+from .metrics import NULL_METRICS
+from .session import MintSession
+
+_LOGGER = logging.getLogger(__name__)
+
+MINT_ROOT_URL = 'https://mint.intuit.com'
+JSON_HEADER = {'accept': 'application/json'}
+HTTP_TIMEOUT = 60
+
+BACKEND_SELENIUM = 'selenium'
+BACKEND_HTTP = 'http'
+BACKEND_FAKE = 'fake'
+
+# Account types requested from MintAccountService, as mintapi does
+MINT_ACCOUNT_TYPES = [
+    'BANK',
+    'CREDIT',
+    'INVESTMENT',
+    'LOAN',
+    'MORTGAGE',
+    'OTHER_PROPERTY',
+    'REAL_ESTATE',
+    'VEHICLE',
+    'UNCLASSIFIED',
+]
+DATE_FIELDS = ['addAccountDate', 'closeDate', 'fiLastUpdated', 'lastUpdated']
+# getJsonData returns cash transactions newest first, this many per page
+TRANSACTIONS_PAGE_SIZE = 100
+
+
+def transactions_path(offset):
+    """Return the getJsonData path for the page of cash transactions starting at offset."""
+    return 'getJsonData.xevent?' + urlencode({
+        'queryNew': '',
+        'offset': offset,
+        'filterType': 'cash',
+        'comparableType': 8,
+        'task': 'transactions',
+        'rnd': random.randint(0, 10 ** 14),
+    })
+
+
+def parse_transactions_page(data):
+    """Return the transaction dicts in a getJsonData response."""
+    try:
+        return data['set'][0].get('data', [])
+    except (KeyError, IndexError, TypeError) as exp:
+        raise BackendError('Could not parse transactions: {!r}'.format(exp))
+
+
+def categories_path():
+    """Return the getJsonData path listing Mint's transaction categories."""
+    return 'getJsonData.xevent?' + urlencode({'task': 'categories', 'rnd': random.randint(0, 10 ** 14)})
+
+
+def parse_categories(data):
+    """Return {category id: name} for a categories response, subcategories included."""
+    try:
+        categories = {}
+        for category in data['set'][0]['data']:
+            categories[category['id']] = category['value']
+            for child in category.get('children', []):
+                categories[child['id']] = child['value']
+        return categories
+    except (KeyError, IndexError, TypeError) as exp:
+        raise BackendError('Could not parse categories: {!r}'.format(exp))
+
+
+def budgets_path(today):
+    """Return the getBudget path for the budgets of today's month."""
+    month = today.strftime('%m/01/%Y')
+    return 'getBudget.xevent?' + urlencode({
+        'startDate': month,
+        'endDate': month,
+        'rnd': random.randint(0, 10 ** 14),
+    })
+
+
+def parse_budgets(data, categories):
+    """Return the month's spending budgets in a getBudget response, 'cat' turned into a category name."""
+    try:
+        months = data['data']['spending']
+        budgets = months[max(months, key=int)]['bu'] if months else []
+    except (KeyError, TypeError, ValueError) as exp:
+        raise BackendError('Could not parse budgets: {!r}'.format(exp))
+    for budget in budgets:
+        budget['cat'] = categories.get(budget.get('cat'), 'Uncategorized')
+    return budgets
+
+
+def add_account_dates(account):
+    """Add the *InDate datetime fields mintapi derives from Mint's epoch milliseconds."""
+    for field in DATE_FIELDS:
+        if account.get(field):
+            account[field + 'InDate'] = datetime.fromtimestamp(account[field] / 1000)
+    return account
+
+
+def build_backend(spec, metrics=NULL_METRICS):
+    """Build one login's MintBackend from a spec dict.
+
+    spec holds the backend kind under 'backend'; username, password,
+    session_path and headless for the browser backends; and seed,
+    fake_accounts, fake_fixture, fake_latency (seconds), fake_failure_rate,
+    transactions and budgets for the fake one.
+    """
+    backend = spec.get('backend', BACKEND_SELENIUM)
+    if backend == BACKEND_FAKE:
+        from .fake import FakeBackend, generate_accounts, generate_budgets, generate_transactions, load_accounts
+
+        seed = spec.get('seed', 0)
+        if spec.get('fake_fixture'):
+            accounts = load_accounts(spec['fake_fixture'])
+        else:
+            accounts = generate_accounts(spec.get('fake_accounts', 100), seed=seed)
+        return FakeBackend(
+            accounts,
+            latency=spec.get('fake_latency', 0.0),
+            failure_rate=spec.get('fake_failure_rate', 0.0),
+            volatility=0.001,
+            transactions=generate_transactions(10 * len(accounts), seed=seed) if spec.get('transactions') else None,
+            budgets=generate_budgets(seed=seed) if spec.get('budgets') else None)
+
+    session = MintSession(
+        spec['username'],
+        spec['password'],
+        spec['session_path'],
+        headless=spec.get('headless', False),
+        metrics=metrics)
+    if backend == BACKEND_HTTP:
+        return HttpBackend(session)
+    return SeleniumBackend(session)
+
+
+class BackendError(Exception):
+    """A Mint call failed; retrying after invalidate() may succeed."""
+
+
+class MintBackend(object):
+    """Interface MintClient uses to reach Mint."""
+
+    def get_accounts(self):
+        """Return a list of mintapi style account dicts."""
+        raise NotImplementedError
+
+    def initiate_account_refresh(self):
+        """Ask Mint to refresh every institution."""
+        raise NotImplementedError
+
+    def get_transactions(self, offset=0):
+        """Return one page of raw cash transactions, newest first; empty past the last one."""
+        raise NotImplementedError
+
+    def get_budgets(self):
+        """Return this month's spending budgets as getBudget dicts, 'cat' holding the category name."""
+        raise NotImplementedError
+
+    def invalidate(self):
+        """Forget cached auth after a failure so the next call starts over."""
+
+    def close(self):
+        """Release browsers, connections and other resources."""
+
+    @property
+    def stats(self):
+        """Return counters to expose as attributes."""
+        return {}
+
+
+def browser_errors():
+    """Return the exceptions a failed login or request through the mintapi browser raises.
+
+    Only looked up once one was raised, so none of these modules is imported for nothing.
+    """
+    return mintapi_api.MintException, selenium_exceptions.WebDriverException, requests.RequestException
+
+
+class SeleniumBackend(MintBackend):
+    """Run every call through the warm mintapi browser session."""
+
+    def __init__(self, session):
+        self.session = session
+        self._categories = None
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.session.acquire(), method)(*args, **kwargs)
+        except browser_errors() as exp:
+            raise BackendError('{}: {}'.format(type(exp).__name__, exp)) from exp
+
+    def _get_json(self, path, what):
+        response = self._call('get', '{}/{}'.format(MINT_ROOT_URL, path), headers=JSON_HEADER)
+        try:
+            return response.json()
+        except ValueError as exp:
+            self.invalidate()
+            raise BackendError('Could not parse {}: {}'.format(what, response.text[:200])) from exp
+
+    def get_accounts(self):
+        return self._call('get_accounts')
+
+    def initiate_account_refresh(self):
+        self._call('initiate_account_refresh')
+
+    def get_transactions(self, offset=0):
+        return parse_transactions_page(self._get_json(transactions_path(offset), 'transactions'))
+
+    def get_budgets(self):
+        # Categories hardly ever change; look them up once per backend
+        if self._categories is None:
+            self._categories = parse_categories(self._get_json(categories_path(), 'categories'))
+        return parse_budgets(self._get_json(budgets_path(date.today()), 'budgets'), self._categories)
+
+    def invalidate(self):
+        self.session.invalidate()
+
+    def close(self):
+        self.session.close()
+
+    @property
+    def stats(self):
+        return self.session.stats
+
+
+class HttpBackend(MintBackend):
+    """Log in with the browser once, then fetch over pooled HTTP requests."""
+
+    def __init__(self, session, base_url=MINT_ROOT_URL, pool_size=4, timeout=HTTP_TIMEOUT):
+        self.session = session
+        self._base_url = base_url.rstrip('/')
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._http = None
+        self._token = None
+        self._request_id = 42
+        self._categories = None
+        self.login_count = 0
+        self.request_count = 0
+
+    def login(self):
+        """Log in through the browser, copy its cookies and token, and close it."""
+        try:
+            mint = self.session.acquire()
+            cookies = mint.driver.get_cookies()
+            user_agent = mint.driver.execute_script('return navigator.userAgent')
+            token = mint.token
+        except browser_errors() as exp:
+            raise BackendError('{}: {}'.format(type(exp).__name__, exp)) from exp
+        finally:
+            # The browser is only needed for the login itself
+            self.session.close()
+
+        http = requests.Session()
+        adapter = requests_adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+        http.mount('https://', adapter)
+        http.mount('http://', adapter)
+        http.headers['User-Agent'] = user_agent
+        for cookie in cookies:
+            http.cookies.set(cookie['name'], cookie['value'],
+                             domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        self.use_http_session(http, token)
+        self.login_count += 1
+
+    def use_http_session(self, http, token):
+        """Adopt an already authenticated requests session and token."""
+        if self._http is not None:
+            self._http.close()
+        self._http = http
+        self._token = token
+
+    def _next_request_id(self):
+        self._request_id += 1
+        return str(self._request_id)
+
+    def _post(self, path, **kwargs):
+        return self._request('post', path, **kwargs)
+
+    def _ensure_login(self):
+        """Log in if needed and return the API token for the request being built."""
+        if self._http is None:
+            self.login()
+        return self._token
+
+    def _request(self, method, path, **kwargs):
+        self._ensure_login()
+        self.request_count += 1
+        try:
+            response = self._http.request(
+                method, '{}/{}'.format(self._base_url, path), headers=JSON_HEADER, timeout=self._timeout, **kwargs)
+        except requests.RequestException as exp:
+            raise BackendError(str(exp)) from exp
+        if response.status_code in (401, 403) or '/login' in response.url:
+            self.invalidate()
+            raise BackendError('Mint session expired (HTTP {})'.format(response.status_code))
+        if response.status_code != 200:
+            raise BackendError('Mint returned HTTP {}'.format(response.status_code))
+        return response
+
+    def get_accounts(self):
+        token = self._ensure_login()
+        request_id = self._next_request_id()
+        request = {
+            'args': {'types': MINT_ACCOUNT_TYPES},
+            'id': request_id,
+            'service': 'MintAccountService',
+            'task': 'getAccountsSorted',
+        }
+        response = self._post(
+            'bundledServiceController.xevent?legacy=false&token={}'.format(token),
+            data={'input': json.dumps([request])})
+        if request_id not in response.text:
+            self.invalidate()
+            raise BackendError('Could not parse account data: {}'.format(response.text[:200]))
+
+        try:
+            accounts = response.json()['response'][request_id]['response']
+        except (KeyError, TypeError, ValueError) as exp:
+            self.invalidate()
+            raise BackendError('Could not parse account data: {}'.format(response.text[:200])) from exp
+        for account in accounts:
+            add_account_dates(account)
+        return accounts
+
+    def initiate_account_refresh(self):
+        self._post('refreshFILogins.xevent', data={'token': self._ensure_login()})
+
+    def _get_json(self, path, what):
+        response = self._request('get', path)
+        try:
+            return response.json()
+        except ValueError as exp:
+            self.invalidate()
+            raise BackendError('Could not parse {}: {}'.format(what, response.text[:200])) from exp
+
+    def get_transactions(self, offset=0):
+        return parse_transactions_page(self._get_json(transactions_path(offset), 'transactions'))
+
+    def get_budgets(self):
+        if self._categories is None:
+            self._categories = parse_categories(self._get_json(categories_path(), 'categories'))
+        return parse_budgets(self._get_json(budgets_path(date.today()), 'budgets'), self._categories)
+
+    def invalidate(self):
+        if self._http is not None:
+            self._http.close()
+        self._http = None
+        self._token = None
+
+    def close(self):
+        self.invalidate()
+        self.session.close()
+
+    @property
+    def stats(self):
+        stats = dict(self.session.stats)
+        stats['http_logins'] = self.login_count
+        stats['http_requests'] = self.request_count
+        return stats
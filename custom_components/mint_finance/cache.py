@@ -0,0 +1,43 @@
+"""
+On-disk cache of the last good Mint snapshot.
+
+Lets the sensors come up with the previous values straight away on startup
+while the first (slow, browser driven) fetch runs in the background.
+"""
+
+import logging
+
+from homeassistant.helpers.storage import Store
+
+from .models import ACCOUNT_FIELDS, account_from_row, account_to_row
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = 'mint_finance.snapshot'
+STORAGE_VERSION = 1
+
+
+class SnapshotCache(object):
+    """Persist normalized accounts as compact rows under .storage."""
+
+    def __init__(self, hass, key=STORAGE_KEY):
+        self._store = Store(hass, STORAGE_VERSION, key)
+
+    async def async_load(self):
+        """Return (accounts, fetched_at) from disk, or None when there is no usable cache."""
+        try:
+            data = await self._store.async_load()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning('Could not read the mint snapshot cache', exc_info=True)
+            return None
+        if not data or data.get('fields') != list(ACCOUNT_FIELDS):
+            return None
+        accounts = tuple(account_from_row(row) for row in data['accounts'])
+        return accounts, data['fetched_at']
+
+    async def async_save(self, accounts, fetched_at):
+        await self._store.async_save({
+            'fetched_at': fetched_at,
+            'fields': list(ACCOUNT_FIELDS),
+            'accounts': [account_to_row(account) for account in accounts],
+        })
@@ -0,0 +1,132 @@
+"""
+Currency rates for account_currency_override.
+
+The ECB history shipped with (or downloaded for) currency_converter is parsed
+once and boiled down to a single day's table of rates against EUR, which is
+cached as a small JSON file. Conversions are then two dict lookups, and
+restarts read the JSON file instead of the whole history.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+
+from .lazy import currency_converter
+
+_LOGGER = logging.getLogger(__name__)
+
+ECB_URL = 'https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist.zip'
+RATES_CACHE = '.mint-rates.json'
+REFRESH_INTERVAL = 24 * 60 * 60  # ECB publishes once per working day
+DOWNLOAD_TIMEOUT = 30
+
+_RATES = None
+
+
+def get_currency_rates(cache_path, download=True):
+    """Return the process wide rates table, creating it on first use."""
+    global _RATES
+    if _RATES is None:
+        _RATES = CurrencyRates(cache_path, download=download)
+    return _RATES
+
+
+class CurrencyRates(object):
+    """Latest day's rates, keyed by currency code, in units per EUR."""
+
+    def __init__(self, cache_path, download=True, refresh_interval=REFRESH_INTERVAL):
+        self._cache_path = cache_path
+        self._download = download
+        self._refresh_interval = refresh_interval
+        self._rates = {}
+        self.date = None
+        self.loaded_at = None
+
+    def convert(self, amount, currency, new_currency):
+        """Convert amount from currency to new_currency using the latest rates."""
+        if currency == new_currency:
+            return amount
+        try:
+            return amount / self._rates[currency] * self._rates[new_currency]
+        except KeyError as exp:
+            raise ValueError('{} is not a supported currency'.format(exp.args[0]))
+
+    def refresh_if_due(self):
+        """Load or rebuild the table when it is missing or older than the interval.
+
+        This does file and network I/O and must run off the event loop.
+        """
+        if self.loaded_at is not None and time.time() - self.loaded_at < self._refresh_interval:
+            return
+        if not self._rates and self._load_cache():
+            if time.time() - self.loaded_at < self._refresh_interval:
+                return
+        try:
+            self._rebuild()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception('Could not rebuild currency rates, keeping rates from %s', self.date)
+            # Do not retry on every cycle
+            self.loaded_at = time.time()
+
+    def _load_cache(self):
+        try:
+            with open(self._cache_path) as cache_file:
+                data = json.load(cache_file)
+            self._rates = data['rates']
+            self.date = data['date']
+            self.loaded_at = data['loaded_at']
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def _save_cache(self):
+        tmp_path = self._cache_path + '.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump({
+                'date': self.date,
+                'loaded_at': self.loaded_at,
+                'rates': self._rates,
+            }, cache_file)
+        os.replace(tmp_path, self._cache_path)
+
+    def _fetch_history(self):
+        """Download the ECB history next to the cache, or return None to use the bundled copy."""
+        history_path = os.path.splitext(self._cache_path)[0] + '.zip'
+        if self._download:
+            import urllib.request
+
+            try:
+                # Runs on the fetch worker; a stalled download must not hold up the fetches
+                with urllib.request.urlopen(ECB_URL, timeout=DOWNLOAD_TIMEOUT) as response, \
+                        open(history_path + '.tmp', 'wb') as history_file:
+                    shutil.copyfileobj(response, history_file)
+                os.replace(history_path + '.tmp', history_path)
+            except Exception as exp:  # pylint: disable=broad-except
+                _LOGGER.warning('Could not download currency rates: %s', exp)
+        return history_path if os.path.exists(history_path) else None
+
+    def _rebuild(self):
+        history_path = self._fetch_history()
+        if history_path:
+            converter = currency_converter.CurrencyConverter(history_path)
+        else:
+            converter = currency_converter.CurrencyConverter()
+
+        # Each currency at its own last date: the history keeps currencies the
+        # ECB no longer publishes, which have no rate on the latest day
+        rates = {'EUR': 1.0}
+        for currency, bounds in converter.bounds.items():
+            try:
+                rates[currency] = converter.convert(1, 'EUR', currency, date=bounds.last_date)
+            except (currency_converter.RateNotFoundError, ValueError) as exp:
+                _LOGGER.debug('No rate for %s: %s', currency, exp)
+        self._rates = rates
+        self.date = max(bounds.last_date for bounds in converter.bounds.values()).isoformat()
+        self.loaded_at = time.time()
+        _LOGGER.info('Loaded %s currency rates for %s', len(self._rates), self.date)
+        try:
+            self._save_cache()
+        except OSError as exp:
+            _LOGGER.warning('Could not cache currency rates: %s', exp)
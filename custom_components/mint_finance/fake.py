@@ -0,0 +1,331 @@
+"""
+Offline stand-ins for Mint.
+
+generate_accounts builds any number of synthetic, mintapi shaped accounts
+spread over every account type, generate_transactions a matching history
+of cash transactions and generate_budgets a budget per spending category. FakeBackend serves them in process and
+FakeMintServer serves them over HTTP for HttpBackend; both can add latency
+and inject failures, so throughput and failure handling can be measured
+and exercised without a Mint login.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from .backend import BackendError, MintBackend, TRANSACTIONS_PAGE_SIZE, add_account_dates
+
+_LOGGER = logging.getLogger(__name__)
+
+# Mint's accountType values, including the ones without a category sensor
+FAKE_ACCOUNT_TYPES = [
+    'bank',
+    'credit',
+    'investment',
+    'loan',
+    'mortgage',
+    'other property',
+    'real estate',
+    'vehicle',
+    'unclassified',
+]
+FAKE_INSTITUTIONS = ['First Fake Bank', 'Example Credit Union', 'Sample Brokerage', 'Test Lending']
+FAKE_CURRENCIES = ['USD', 'USD', 'USD', 'CAD', 'INR']
+# (category, merchants, is spending)
+FAKE_CATEGORIES = [
+    ('Groceries', ['Corner Market', 'Fresh Foods'], True),
+    ('Restaurants', ['Noodle Bar', 'Pizza Place'], True),
+    ('Gas & Fuel', ['Fuel Stop'], True),
+    ('Utilities', ['City Power', 'Water Works'], True),
+    ('Shopping', ['Online Store'], True),
+    ('Paycheck', ['Employer Inc'], False),
+    ('Transfer', ['Savings Transfer'], False),
+]
+# Mint category ids FakeMintServer reports the categories under
+FAKE_CATEGORY_IDS = dict((category, 700 + index) for index, (category, _, _) in enumerate(FAKE_CATEGORIES))
+
+
+def generate_accounts(count, seed=0, closed_ratio=0.05, now=None):
+    """Return `count` synthetic mintapi account dicts; the same seed gives the same accounts.
+
+    Ids start at 1000000 times seed + 1, so accounts generated for different
+    fake logins do not collide.
+    """
+    rng = random.Random(seed)
+    first_id = 1000000 * (seed + 1)
+    now_ms = int((now or time.time()) * 1000)
+    accounts = []
+    for index in range(count):
+        account_type = FAKE_ACCOUNT_TYPES[index % len(FAKE_ACCOUNT_TYPES)]
+        closed = rng.random() < closed_ratio
+        accounts.append(add_account_dates({
+            'id': first_id + index,
+            'accountName': '{} {}'.format(account_type.title(), index),
+            'fiName': rng.choice(FAKE_INSTITUTIONS),
+            'accountType': account_type,
+            'currentBalance': round(rng.uniform(0, 250000), 2),
+            'currency': rng.choice(FAKE_CURRENCIES),
+            'lastUpdated': now_ms - rng.randint(0, 6 * 60 * 60 * 1000),
+            'isActive': not closed,
+            'isAccountNotFound': False,
+            'isClosed': closed,
+        }))
+    return accounts
+
+
+def mint_date(day, today):
+    """Format a date the way getJsonData does: 'Oct 15' this year, '10/15/18' before."""
+    if day.year == today.year:
+        return '{} {}'.format(day.strftime('%b'), day.day)
+    return day.strftime('%m/%d/%y')
+
+
+def generate_transactions(count, seed=0, days=365, today=None, first_id=None):
+    """Return `count` synthetic getJsonData transaction dicts, newest first, over `days` days."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    first_id = 5000000 * (seed + 1) if first_id is None else first_id
+    offsets = sorted(rng.randint(0, days) for _ in range(count))
+    transactions = []
+    for index, offset in enumerate(offsets):
+        category, merchants, spending = rng.choice(FAKE_CATEGORIES)
+        debit = spending or category == 'Transfer'
+        amount = rng.uniform(2, 200) if spending else rng.uniform(500, 5000)
+        transactions.append({
+            'id': first_id + count - index,
+            'date': mint_date(today - timedelta(days=offset), today),
+            'merchant': rng.choice(merchants),
+            'amount': '${:,.2f}'.format(amount),
+            'isDebit': debit,
+            'category': category,
+            'isSpending': spending,
+            'isTransfer': category == 'Transfer',
+            'isDuplicate': False,
+            'isPending': offset < 2 and rng.random() < 0.3,
+            'account': 'Bank {}'.format(seed),
+            'fi': rng.choice(FAKE_INSTITUTIONS),
+        })
+    return transactions
+
+
+def generate_budgets(seed=0):
+    """Return a getBudget dict for every spending category, 'cat' holding the category name."""
+    rng = random.Random(seed)
+    budgets = []
+    for index, (category, _, spending) in enumerate(FAKE_CATEGORIES):
+        if not spending:
+            continue
+        limit = float(rng.randint(1, 20) * 50)
+        spent = round(limit * rng.uniform(0, 1.2), 2)
+        budgets.append({
+            'id': 9000000 * (seed + 1) + index,
+            'cat': category,
+            'amt': spent,
+            'bgt': limit,
+            'rbal': round(limit - spent, 2),
+        })
+    return budgets
+
+
+def load_accounts(path):
+    """Load a JSON fixture holding a list of mintapi account dicts."""
+    with open(path) as fixture:
+        return [add_account_dates(account) for account in json.load(fixture)]
+
+
+class FailureInjector(object):
+    """Latency and failure settings shared by the fake backend and server."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.forced_failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fail_next(self, count=1):
+        """Make the next `count` calls fail regardless of failure_rate."""
+        with self._lock:
+            self.forced_failures += count
+
+    def should_fail(self):
+        with self._lock:
+            if self.forced_failures:
+                self.forced_failures -= 1
+                return True
+            return self._rng.random() < self.failure_rate
+
+    def wait(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._rng.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+
+class FakeBackend(MintBackend):
+    """In-process backend serving fixture accounts.
+
+    Each fetch moves every open balance by up to `volatility` (a fraction)
+    so change detection and history have something to do. Budget spending
+    only grows, on one budget fetch in ten.
+    """
+
+    def __init__(self, accounts, latency=0.0, failure_rate=0.0, volatility=0.0, seed=None, transactions=None,
+                 budgets=None):
+        self.accounts = accounts
+        self.transactions = transactions or []
+        self.budgets = budgets or []
+        self.injector = FailureInjector(latency, failure_rate, seed)
+        self.volatility = volatility
+        self._rng = random.Random(seed)
+        self.call_count = 0
+        self.failure_count = 0
+        self.refresh_count = 0
+
+    def _call(self):
+        self.call_count += 1
+        self.injector.wait()
+        if self.injector.should_fail():
+            self.failure_count += 1
+            raise BackendError('Injected failure')
+
+    def get_accounts(self):
+        self._call()
+        if self.volatility:
+            for account in self.accounts:
+                account['currentBalance'] = round(
+                    account['currentBalance'] * (1 + self._rng.uniform(-self.volatility, self.volatility)), 2)
+        return [dict(account) for account in self.accounts]
+
+    def initiate_account_refresh(self):
+        self._call()
+        self.refresh_count += 1
+
+    def get_transactions(self, offset=0):
+        self._call()
+        return [dict(transaction) for transaction in self.transactions[offset:offset + TRANSACTIONS_PAGE_SIZE]]
+
+    def get_budgets(self):
+        self._call()
+        if self.volatility and self.budgets and self._rng.random() < 0.1:
+            budget = self._rng.choice(self.budgets)
+            budget['amt'] = round(budget['amt'] + budget['bgt'] * self._rng.uniform(0, self.volatility), 2)
+            budget['rbal'] = round(budget['bgt'] - budget['amt'], 2)
+        return [dict(budget) for budget in self.budgets]
+
+    @property
+    def stats(self):
+        return {
+            'fake_calls': self.call_count,
+            'fake_failures': self.failure_count,
+        }
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeMintServer(object):
+    """Local HTTP server answering the calls HttpBackend makes."""
+
+    def __init__(self, accounts, latency=0.0, failure_rate=0.0, host='127.0.0.1', port=0, token=None,
+                 transactions=None, budgets=None):
+        self.accounts = accounts
+        self.transactions = transactions or []
+        self.budgets = budgets or []
+        self.injector = FailureInjector(latency, failure_rate)
+        self.token = token
+        self.request_count = 0
+        self._server = _ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                _LOGGER.debug(format, *args)
+
+            def _reply(self, status, body=b''):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server.request_count += 1
+                url = urlparse(self.path)
+                server.injector.wait()
+                if server.injector.should_fail():
+                    return self._reply(503)
+                query = parse_qs(url.query)
+                if url.path.endswith('/getBudget.xevent'):
+                    budgets = [dict(budget, cat=FAKE_CATEGORY_IDS[budget['cat']]) for budget in server.budgets]
+                    body = json.dumps({'data': {'spending': {'0': {'bu': budgets}}, 'income': {}}})
+                    return self._reply(200, body.encode())
+                if not url.path.endswith('/getJsonData.xevent'):
+                    return self._reply(404)
+                if query.get('task') == ['categories']:
+                    categories = [{'id': category_id, 'value': category, 'children': []}
+                                  for category, category_id in sorted(FAKE_CATEGORY_IDS.items())]
+                    return self._reply(200, json.dumps({'set': [{'data': categories}]}).encode())
+                offset = int(query.get('offset', ['0'])[0])
+                page = server.transactions[offset:offset + TRANSACTIONS_PAGE_SIZE]
+                body = json.dumps({'set': [{'data': page}]})
+                return self._reply(200, body.encode())
+
+            def do_POST(self):
+                server.request_count += 1
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                url = urlparse(self.path)
+                token = parse_qs(url.query).get('token', form.get('token', [None]))[0]
+
+                server.injector.wait()
+                if server.injector.should_fail():
+                    return self._reply(503)
+                if server.token is not None and token != server.token:
+                    return self._reply(401)
+
+                if url.path.endswith('/refreshFILogins.xevent'):
+                    return self._reply(200, b'{}')
+                if not url.path.endswith('/bundledServiceController.xevent'):
+                    return self._reply(404)
+
+                request = json.loads(form['input'][0])[0]
+                accounts = [
+                    dict((key, value) for key, value in account.items() if not key.endswith('InDate'))
+                    for account in server.accounts]
+                body = json.dumps({'response': {request['id']: {'response': accounts}}})
+                return self._reply(200, body.encode())
+
+        return Handler
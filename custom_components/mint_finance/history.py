@@ -0,0 +1,161 @@
+"""
+Per-account balance history.
+
+An append-only, columnar store kept next to the Home Assistant config:
+one file per column, fixed width records, written with array.tofile and
+read back with array.fromfile. A row is only appended when an account's
+balance differs from the last one recorded for it, so an unchanged account
+costs nothing however often Mint is polled.
+
+    timestamps.bin  float64  seconds since the epoch, non-decreasing
+    accounts.bin    int64    Mint account id
+    balances.bin    float64  balance in unit_of_measurement, sign-formatted
+"""
+
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_PATH = '.mint-history'
+
+COLUMNS = (
+    ('timestamps', 'd'),
+    ('accounts', 'q'),
+    ('balances', 'd'),
+)
+
+
+class BalanceHistory(object):
+    """Columnar balance history backed by typed arrays."""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.timestamps = array('d')
+        self.accounts = array('q')
+        self.balances = array('d')
+        self._last = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _column_path(self, name):
+        return os.path.join(self._path, name + '.bin')
+
+    def _columns(self):
+        return [(name, getattr(self, name)) for name, _ in COLUMNS]
+
+    def load(self):
+        """Read the column files into memory; safe to call more than once."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self._path, exist_ok=True)
+        sizes = {}
+        for name, column in self._columns():
+            try:
+                with open(self._column_path(name), 'rb') as column_file:
+                    data = column_file.read()
+            except FileNotFoundError:
+                continue
+            sizes[name] = len(data)
+            # Drop a partially written trailing record
+            usable = len(data) - len(data) % column.itemsize
+            column.frombytes(data[:usable])
+
+        # A crash between column writes leaves the columns uneven; keep the
+        # complete rows only and rewrite every file holding more than those,
+        # so the next append starts on a record boundary.
+        rows = min(len(column) for _, column in self._columns())
+        for name, column in self._columns():
+            if sizes.get(name, 0) != rows * column.itemsize:
+                _LOGGER.warning('Truncating balance history column %s to %s rows', name, rows)
+                del column[rows:]
+                with open(self._column_path(name), 'wb') as column_file:
+                    column.tofile(column_file)
+
+        for account_id, balance in zip(self.accounts, self.balances):
+            self._last[account_id] = balance
+        self._loaded = True
+        _LOGGER.debug('Loaded %s balance history rows', rows)
+
+    def append(self, timestamp, balances):
+        """Record {account id: balance}, skipping unchanged values.
+
+        Accounts seen before but missing from `balances` (closed or
+        excluded) are recorded once with a zero balance. Returns the number
+        of rows written.
+        """
+        with self._lock:
+            self._load()
+            rows = [(account_id, float(balance)) for account_id, balance in balances.items()
+                    if self._last.get(account_id) != balance]
+            rows.extend((account_id, 0.0) for account_id, balance in self._last.items()
+                        if balance != 0.0 and account_id not in balances)
+            if not rows:
+                return 0
+
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                timestamp = self.timestamps[-1]
+            new = (
+                array('d', [timestamp] * len(rows)),
+                array('q', [account_id for account_id, _ in rows]),
+                array('d', [balance for _, balance in rows]),
+            )
+            # Every file is written before any column grows in memory, and a
+            # failed write cuts the files back, so the columns stay even
+            sizes = [len(column) * column.itemsize for _, column in self._columns()]
+            try:
+                for (name, _), values in zip(self._columns(), new):
+                    with open(self._column_path(name), 'ab') as column_file:
+                        values.tofile(column_file)
+            except OSError:
+                self._truncate_files(sizes)
+                raise
+            for (_, column), values in zip(self._columns(), new):
+                column.extend(values)
+            self._last.update(rows)
+            return len(rows)
+
+    def _truncate_files(self, sizes):
+        """Cut the column files back to sizes (bytes) after a failed append."""
+        try:
+            for (name, _), size in zip(self._columns(), sizes):
+                path = self._column_path(name)
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    os.truncate(path, size)
+        except OSError:
+            _LOGGER.warning('Could not undo a failed balance history write', exc_info=True)
+            # Reload on next use; loading keeps the complete rows only
+            for _, column in self._columns():
+                del column[:]
+            self._last = {}
+            self._loaded = False
+
+    def query(self, start=None, end=None, account_ids=None, limit=None):
+        """Return the first limit (timestamp, account id, balance) rows with start <= timestamp <= end."""
+        with self._lock:
+            self._load()
+            low = 0 if start is None else bisect_left(self.timestamps, start)
+            high = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+            wanted = frozenset(account_ids) if account_ids else None
+            return list(islice((
+                (self.timestamps[index], self.accounts[index], self.balances[index])
+                for index in range(low, high)
+                if wanted is None or self.accounts[index] in wanted
+            ), limit))
+
+    def columns(self):
+        """Return copies of the three columns, for batch analytics."""
+        with self._lock:
+            self._load()
+            return array('d', self.timestamps), array('q', self.accounts), array('d', self.balances)
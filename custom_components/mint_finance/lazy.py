@@ -0,0 +1,69 @@
+"""
+Deferred imports of the heavy dependencies.
+
+mintapi pulls in Selenium, NumPy takes a noticeable while to import, and
+none of them are needed to set the platform up. Each is wrapped in a
+LazyModule that imports it on first use, which happens on MintClient's
+worker thread, and only if the configuration needs it: the fake backend
+never loads mintapi, and without trends NumPy is never loaded. Load times
+are recorded under the import stage when diagnostics are on.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+from .metrics import NULL_METRICS, STAGE_IMPORT
+
+_LOGGER = logging.getLogger(__name__)
+
+_metrics = NULL_METRICS
+
+
+def set_metrics(metrics):
+    """Record import times into metrics from now on."""
+    global _metrics
+    _metrics = metrics
+
+
+class LazyModule(object):
+    """A module that is imported the first time it is used."""
+
+    def __init__(self, name):
+        self.name = name
+        self.load_seconds = None
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """Import the module once and return it."""
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(self.name)
+                self.load_seconds = time.perf_counter() - started
+                _metrics.record(STAGE_IMPORT, self.load_seconds)
+                _LOGGER.debug('Imported %s in %.3fs', self.name, self.load_seconds)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+mintapi = LazyModule('mintapi')
+mintapi_api = LazyModule('mintapi.api')
+numpy = LazyModule('numpy')
+psutil = LazyModule('psutil')
+requests = LazyModule('requests')
+requests_adapters = LazyModule('requests.adapters')
+selenium_exceptions = LazyModule('selenium.common.exceptions')
+currency_converter = LazyModule('currency_converter')
@@ -0,0 +1,178 @@
+"""
+Timing and counters for the Mint update pipeline.
+
+MintClient, the session and the sensors record how long each stage of a
+cycle takes and count the events that explain slow cycles, such as logins,
+retries and snapshot reuse. When diagnostics are off they are handed
+NULL_METRICS instead, whose methods do nothing, so the hot path only pays
+for an attribute lookup and an empty call.
+
+Stages nest: fetch includes any login it triggers, and aggregate includes
+convert. first_update is recorded once, from platform setup to the first
+live snapshot.
+"""
+
+import threading
+import time
+
+STAGE_IMPORT = 'import'
+STAGE_LOGIN = 'login'
+STAGE_FETCH = 'fetch'
+STAGE_NORMALIZE = 'normalize'
+STAGE_CONVERT = 'convert'
+STAGE_AGGREGATE = 'aggregate'
+STAGE_HISTORY = 'history'
+STAGE_PUBLISH = 'publish'
+STAGE_SENSOR_UPDATE = 'sensor_update'
+STAGE_TRANSACTIONS = 'transactions'
+STAGE_BUDGETS = 'budgets'
+STAGE_FIRST_UPDATE = 'first_update'
+
+STAGES = {
+    STAGE_IMPORT: 'Import',
+    STAGE_LOGIN: 'Login',
+    STAGE_FETCH: 'Fetch',
+    STAGE_NORMALIZE: 'Normalize',
+    STAGE_CONVERT: 'Convert',
+    STAGE_AGGREGATE: 'Aggregate',
+    STAGE_HISTORY: 'History',
+    STAGE_PUBLISH: 'Publish',
+    STAGE_SENSOR_UPDATE: 'Sensor Update',
+    STAGE_TRANSACTIONS: 'Transaction Sync',
+    STAGE_BUDGETS: 'Budgets',
+    STAGE_FIRST_UPDATE: 'First Update',
+}
+
+COUNTER_FETCHES = 'fetches'
+COUNTER_FETCH_FAILURES = 'fetch_failures'
+COUNTER_SNAPSHOT_HITS = 'snapshot_cache_hits'
+COUNTER_CATEGORY_REUSES = 'category_reuses'
+COUNTER_RETRIES = 'retries'
+COUNTER_LOGINS = 'logins'
+COUNTER_TOKEN_REFRESHES = 'token_refreshes'
+COUNTER_CIRCUIT_REJECTIONS = 'circuit_rejections'
+COUNTER_UNCHANGED_CYCLES = 'unchanged_cycles'
+COUNTER_BROWSER_RECYCLES = 'browser_recycles'
+COUNTER_ORPHANS_REAPED = 'orphans_reaped'
+
+
+class Metrics(object):
+    """Thread safe stage timings and counters."""
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # stage -> [count, total, last, max] in seconds
+        self._timings = {}
+        self._counters = {}
+        self.started_at = time.time()
+
+    def timer(self, stage):
+        """Return a context manager that records the time spent in its block under stage."""
+        return _Timer(self, stage)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                self._timings[stage] = [1, seconds, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = seconds
+                timing[3] = max(timing[3], seconds)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def timing(self, stage):
+        """Return {count, total, last, mean, max} for stage, or None before its first run."""
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                return None
+            count, total, last, longest = timing
+        return {
+            'count': count,
+            'total': total,
+            'last': last,
+            'mean': total / count,
+            'max': longest,
+        }
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def dump(self):
+        """Return every timing and counter as plain JSON-friendly data."""
+        with self._lock:
+            stages = list(self._timings)
+        return {
+            'enabled': self.enabled,
+            'started_at': self.started_at,
+            'timings': dict((stage, self.timing(stage)) for stage in stages),
+            'counters': self.counters(),
+        }
+
+
+class _Timer(object):
+
+    __slots__ = ('_metrics', '_stage', '_started')
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.record(self._stage, time.perf_counter() - self._started)
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics(Metrics):
+    """Metrics that record nothing, used when diagnostics are off."""
+
+    enabled = False
+
+    def __init__(self):
+        self.started_at = None
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def record(self, stage, seconds):
+        pass
+
+    def increment(self, counter, amount=1):
+        pass
+
+    def timing(self, stage):
+        return None
+
+    def counters(self):
+        return {}
+
+    def dump(self):
+        return {'enabled': False, 'started_at': None, 'timings': {}, 'counters': {}}
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,121 @@
+"""
+Normalized Mint records.
+
+mintapi hands back large mutable dicts with dozens of fields per account.
+They are reduced once per fetch to small immutable records holding only
+what the sensors read, so snapshots can be shared freely and nothing
+downstream can flip a sign or convert a balance twice.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+ACCOUNT_FIELDS = (
+    'id',
+    'accountName',
+    'fiName',
+    'accountType',
+    'currentBalance',
+    'currency',
+    'lastUpdatedInDate',
+    'isActive',
+    'isAccountNotFound',
+    'isClosed',
+)
+
+
+class MintAccount(namedtuple('MintAccount', ACCOUNT_FIELDS)):
+    """Immutable view of one Mint account."""
+
+    __slots__ = ()
+
+    @property
+    def is_open(self):
+        """Return True for accounts Mint still tracks."""
+        return self.isActive and not self.isAccountNotFound and not self.isClosed
+
+
+def normalize_account(account):
+    """Build a MintAccount from a mintapi account dict."""
+    return MintAccount(
+        account.get('id'),
+        account.get('accountName', ''),
+        account.get('fiName', ''),
+        account.get('accountType', ''),
+        account.get('currentBalance', 0.0),
+        account.get('currency', ''),
+        account.get('lastUpdatedInDate'),
+        account.get('isActive') == True,
+        account.get('isAccountNotFound') == True,
+        account.get('isClosed') == True,
+    )
+
+
+def account_to_row(account):
+    """Return a JSON friendly list of the record's values, in ACCOUNT_FIELDS order."""
+    row = list(account)
+    updated = account.lastUpdatedInDate
+    if isinstance(updated, datetime):
+        row[ACCOUNT_FIELDS.index('lastUpdatedInDate')] = updated.timestamp()
+    return row
+
+
+def account_from_row(row):
+    """Inverse of account_to_row."""
+    account = MintAccount(*row)
+    if account.lastUpdatedInDate is not None:
+        account = account._replace(lastUpdatedInDate=datetime.fromtimestamp(account.lastUpdatedInDate))
+    return account
+
+
+def merge_accounts(accounts_by_login):
+    """Concatenate each login's records, dropping accounts an earlier login already returned.
+
+    A joint account has the same id under every login of one Mint user, so
+    it is matched on its id. Logins of different Mint users see it under
+    different ids and nothing else tells it apart from a separate account
+    with the same name and balance; those are left for exclude_accounts.
+    Duplicates within a single login are left alone.
+    """
+    seen_ids = set()
+    merged = []
+    for accounts in accounts_by_login:
+        merged.extend(account for account in accounts if account.id not in seen_ids)
+        seen_ids.update(account.id for account in accounts)
+    return tuple(merged)
+
+
+BUDGET_FIELDS = ('category', 'spent', 'limit')
+
+
+class MintBudget(namedtuple('MintBudget', BUDGET_FIELDS)):
+    """Immutable view of one category's spending budget for the month."""
+
+    __slots__ = ()
+
+    @property
+    def remaining(self):
+        return round(self.limit - self.spent, 2)
+
+    @property
+    def percent(self):
+        """Return the share of the limit spent, in %, or None without a limit."""
+        return round(100 * self.spent / self.limit, 1) if self.limit else None
+
+
+def normalize_budget(budget):
+    """Build a MintBudget from a getBudget dict whose 'cat' holds the category name."""
+    return MintBudget(budget.get('cat', ''), round(budget.get('amt', 0.0), 2), round(budget.get('bgt', 0.0), 2))
+
+
+def merge_budgets(budgets_by_login):
+    """Return {category: MintBudget}, adding up the budgets several logins set for one category."""
+    merged = {}
+    for budgets in budgets_by_login:
+        for budget in budgets:
+            previous = merged.get(budget.category)
+            if previous is not None:
+                budget = MintBudget(budget.category, round(previous.spent + budget.spent, 2),
+                                    round(previous.limit + budget.limit, 2))
+            merged[budget.category] = budget
+    return merged
@@ -0,0 +1,131 @@
+"""
+Retry and circuit breaker helpers for Mint fetches.
+
+RetryPolicy bounds how many times one fetch is attempted and spaces the
+attempts with jittered exponential backoff. CircuitBreaker stops fetching
+altogether after repeated failed cycles so an outage does not keep spinning
+up browsers; while it is open the caller serves its last good data.
+"""
+
+import logging
+import random
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+ATTR_CIRCUIT_STATE = 'circuit_state'
+ATTR_CIRCUIT_FAILURES = 'circuit_failures'
+ATTR_CIRCUIT_RETRY_AT = 'circuit_retry_at'
+ATTR_RETRIES = 'retries'
+
+
+class RetryPolicy(object):
+    """Bounded retries with exponential backoff and jitter."""
+
+    def __init__(self, attempts=3, backoff=5.0, max_backoff=120.0, jitter=0.5):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_count = 0
+
+    def delay(self, attempt):
+        """Return the pause before retry number `attempt` (starting at 1)."""
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        # Spread retries out so several clients do not hammer Mint in step
+        return delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+
+    def call(self, func, retry_on=(Exception,), on_retry=None, sleep=time.sleep):
+        """Call func until it succeeds or the attempts run out.
+
+        on_retry(exception, attempt) runs before every pause, which is where
+        the caller resets whatever state caused the failure. The last
+        exception is re-raised once all attempts have failed.
+        """
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except retry_on as exp:
+                if attempt >= self.attempts:
+                    raise
+                delay = self.delay(attempt)
+                _LOGGER.warning('Attempt %s of %s failed (%s), retrying in %.1fs',
+                                attempt, self.attempts, exp, delay)
+                if on_retry is not None:
+                    on_retry(exp, attempt)
+                self.retry_count += 1
+                sleep(delay)
+                attempt += 1
+
+
+class CircuitBreaker(object):
+    """Open after `failure_threshold` consecutive failures for `reset_timeout` seconds."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=900.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        # When the half-open trial was let through, until its outcome is recorded
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return STATE_CLOSED
+        if time.time() - self._opened_at >= self.reset_timeout:
+            return STATE_HALF_OPEN
+        return STATE_OPEN
+
+    def allow_request(self):
+        """Return True when a fetch may be attempted.
+
+        Once the reset timeout has passed a single trial request is let
+        through; its outcome closes or re-opens the circuit. Until then every
+        other caller is turned away. A trial whose outcome is never recorded
+        gives way to another one after a further reset timeout.
+        """
+        with self._lock:
+            state = self.state
+            if state != STATE_HALF_OPEN:
+                return state == STATE_CLOSED
+            now = time.time()
+            if self._trial_at is not None and now - self._trial_at < self.reset_timeout:
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                _LOGGER.info('Mint circuit closed again')
+            self.failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._opened_at is not None or self.failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    _LOGGER.warning('Mint circuit opened after %s failures', self.failures)
+                self._opened_at = time.time()
+            self._trial_at = None
+
+    @property
+    def stats(self):
+        retry_at = None
+        if self._opened_at is not None:
+            retry_at = self._opened_at + self.reset_timeout
+        return {
+            ATTR_CIRCUIT_STATE: self.state,
+            ATTR_CIRCUIT_FAILURES: self.failures,
+            ATTR_CIRCUIT_RETRY_AT: retry_at,
+        }
@@ -0,0 +1,62 @@
+"""
+Adaptive refresh schedule for Mint fetches.
+
+Mint only pulls new data from the institutions every few hours, so polling
+it every minute mostly returns the same snapshot. The scheduler watches the
+newest lastUpdatedInDate across the accounts: while it stays the same the
+poll interval grows by backoff_factor up to max_interval, and as soon as it
+moves the interval drops back to min_interval. After we ask Mint to refresh
+the institutions ourselves, polling stays at min_interval for the refresh
+window so the new balances are picked up quickly.
+"""
+
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RefreshScheduler(object):
+    """Pick the delay before the next fetch and when to refresh institutions."""
+
+    def __init__(self, min_interval, max_interval, backoff_factor=2.0,
+                 institution_refresh_interval=None, refresh_window=0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.institution_refresh_interval = institution_refresh_interval
+        self.refresh_window = refresh_window
+        self.interval = min_interval
+        self.last_updated = None
+        self.last_institution_refresh = None
+        self._window_until = None
+
+    def record_snapshot(self, accounts):
+        """Adjust the interval from a newly fetched set of accounts."""
+        last_updated = max(
+            (account.lastUpdatedInDate for account in accounts if account.lastUpdatedInDate is not None),
+            default=None)
+        if last_updated != self.last_updated:
+            self.last_updated = last_updated
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+        _LOGGER.debug('Next mint fetch in %.0fs (newest account update %s)', self.interval, last_updated)
+
+    def next_delay(self, now):
+        """Return seconds until the next fetch."""
+        if self._window_until is not None and now < self._window_until:
+            return min(self.interval, self.min_interval)
+        return self.interval
+
+    def institution_refresh_due(self, now):
+        if not self.institution_refresh_interval:
+            return False
+        if self.last_institution_refresh is None:
+            return True
+        return now - self.last_institution_refresh >= self.institution_refresh_interval
+
+    def record_institution_refresh(self, now):
+        """Poll quickly for the refresh window after asking Mint to refresh."""
+        self.last_institution_refresh = now
+        self._window_until = now + self.refresh_window
+        self.interval = self.min_interval
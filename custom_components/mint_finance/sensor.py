@@ -5,67 +5,156 @@ For more details about this platform, please refer to the documentation at
 https://github.com/custom-components/sensor.mint
 """
 
+import asyncio
 import logging
 import voluptuous as vol
 import json
+import threading
 import time
-from datetime import timedelta
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from homeassistant.core import callback
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
 import homeassistant.helpers.config_validation as cv
+from homeassistant.util import slugify
 from homeassistant.components.sensor import (PLATFORM_SCHEMA)
-from homeassistant.util import Throttle
+
+from .aggregate import SENSOR_TYPES, aggregate_accounts
+from .analytics import METRIC_MAX_DRAWDOWN, METRICS, compute_trends
+from .backend import BACKEND_FAKE, BACKEND_HTTP, BACKEND_SELENIUM, BackendError, build_backend
+from .cache import SnapshotCache
+from .currency import RATES_CACHE, get_currency_rates
+from .history import HISTORY_PATH, BalanceHistory
+from . import lazy
+from .metrics import (
+    COUNTER_CIRCUIT_REJECTIONS, COUNTER_FETCH_FAILURES, COUNTER_FETCHES, COUNTER_RETRIES,
+    COUNTER_SNAPSHOT_HITS, COUNTER_UNCHANGED_CYCLES, NULL_METRICS, STAGE_AGGREGATE, STAGE_FETCH,
+    STAGE_FIRST_UPDATE, STAGE_HISTORY, STAGE_NORMALIZE, STAGE_PUBLISH, STAGE_BUDGETS,
+    STAGE_SENSOR_UPDATE, STAGE_TRANSACTIONS, STAGES, Metrics)
+from .models import merge_accounts, merge_budgets, normalize_account, normalize_budget
+from .retry import (
+    ATTR_CIRCUIT_FAILURES, ATTR_CIRCUIT_RETRY_AT, ATTR_CIRCUIT_STATE, ATTR_RETRIES, CircuitBreaker, RetryPolicy)
+from .scheduler import RefreshScheduler
+from .store import AccountStore, BudgetStore
+from .transactions import TRANSACTIONS_PATH, TransactionStore, TransactionSync
+from .watchdog import BROWSER_MAX_AGE, BROWSER_MAX_MEMORY, BrowserWatchdog
+from .worker import WORKER_PATH, WORKER_TIMEOUT, RemoteBackend
 
 from homeassistant.const import (
-    ATTR_ATTRIBUTION, CONF_ID, CONF_NAME, CONF_USERNAME, CONF_PASSWORD)
+    ATTR_ATTRIBUTION, CONF_ID, CONF_NAME, CONF_USERNAME, CONF_PASSWORD,
+    CONF_SCAN_INTERVAL, EVENT_HOMEASSISTANT_STOP)
 
 __version__ = '0.1.0'
 
+DOMAIN = 'mint_finance'
+
 CONF_ATTRIBUTION = "Intuit Mint"
 CONF_EXCLUDE_ACCOUNTS = 'exclude_accounts'
 
 CONF_UNIT_OF_MEASUREMENT = 'unit_of_measurement'
 CONF_CATEGORIES = 'monitored_categories'
 CONF_ACCOUNT_CURRENCY_OVERRIDE = 'account_currency_override'
+CONF_SESSION_PATH = 'session_path'
+CONF_BACKEND = 'backend'
+CONF_LOGINS = 'logins'
+CONF_FETCH_WORKERS = 'fetch_workers'
+CONF_LOGIN_MAX_AGE = 'login_max_age'
+CONF_RETRY_ATTEMPTS = 'retry_attempts'
+CONF_RETRY_BACKOFF = 'retry_backoff'
+CONF_RETRY_MAX_BACKOFF = 'retry_max_backoff'
+CONF_CIRCUIT_THRESHOLD = 'circuit_failure_threshold'
+CONF_CIRCUIT_RESET = 'circuit_reset_timeout'
+CONF_HISTORY = 'history'
+CONF_TRENDS = 'monitored_trends'
+CONF_MAX_SCAN_INTERVAL = 'max_scan_interval'
+CONF_SCAN_BACKOFF_FACTOR = 'scan_backoff_factor'
+CONF_INSTITUTION_REFRESH_INTERVAL = 'institution_refresh_interval'
+CONF_INSTITUTION_REFRESH_WINDOW = 'institution_refresh_window'
+CONF_DIAGNOSTICS = 'diagnostics'
+CONF_ACCOUNT_SENSORS = 'account_sensors'
+CONF_TRANSACTIONS = 'transactions'
+CONF_TRANSACTIONS_INTERVAL = 'transactions_interval'
+CONF_TRANSACTIONS_BACKFILL = 'transactions_backfill'
+CONF_SPENDING_CATEGORIES = 'monitored_spending_categories'
+CONF_BUDGETS = 'budgets'
+CONF_BUDGETS_INTERVAL = 'budgets_interval'
+CONF_MONITORED_BUDGETS = 'monitored_budgets'
+CONF_BROWSER_MAX_MEMORY = 'browser_max_memory'
+CONF_BROWSER_MAX_AGE = 'browser_max_age'
+CONF_WORKER = 'worker'
+CONF_WORKER_TIMEOUT = 'worker_timeout'
+CONF_WORKER_PERSIST = 'worker_persist'
+CONF_FAKE_ACCOUNTS = 'fake_accounts'
+CONF_FAKE_FIXTURE = 'fake_fixture'
+CONF_FAKE_LATENCY = 'fake_latency'
+CONF_FAKE_FAILURE_RATE = 'fake_failure_rate'
 
 SESSION_PATH = '.mint-session'
-# DATA_MINT = 'mint_cache'
+DATA_MINT = DOMAIN
 
 ATTR_NETWORTH = 'networth'
 ATTR_ASSETS = 'assets'
 ATTR_LIABILITIES = 'liabilities'
+ATTR_STALE = 'stale'
+ATTR_TRENDS = 'trends'
+ATTR_DIAGNOSTICS = 'diagnostics'
+ATTR_LOGINS = 'logins'
+ATTR_FAILING_LOGINS = 'failing_logins'
+ATTR_ACCOUNTS = 'accounts'
+ATTR_SPENDING = 'spending'
+ATTR_BUDGETS = 'budgets'
+# Client stats that describe its state; the rest are counters that grow on
+# every fetch and would turn every cycle into a state write
+STATE_STATS = (ATTR_LOGINS, ATTR_FAILING_LOGINS, ATTR_CIRCUIT_STATE, ATTR_CIRCUIT_FAILURES, ATTR_CIRCUIT_RETRY_AT)
 
-# Mint account types
-ATTR_INVESTMENT = 'investment'
-ATTR_MORTGAGE = 'mortgage'
-ATTR_CASH = 'bank'
-ATTR_OTHER_ASSET = 'other property'
-ATTR_CREDIT = 'credit'
-ATTR_LOAN = 'loan'
-ATTR_REAL_ESTATE = 'real estate'
-ATTR_VEHICLE = 'vehicle'
-ATTR_UNCLASSIFIED = 'unclassified'
-
+# Shortest poll interval; scan_interval overrides it and the scheduler
+# backs off from there while Mint has nothing new
 SCAN_INTERVAL = timedelta(minutes=1)
-MIN_TIME_BETWEEN_UPDATES = 5 * 60 # 5 minutes
+MAX_SCAN_INTERVAL = timedelta(hours=1)
+SCAN_BACKOFF_FACTOR = 2.0
+INSTITUTION_REFRESH_WINDOW = timedelta(minutes=15)
+TRANSACTIONS_INTERVAL = timedelta(hours=1)
+TRANSACTIONS_BACKFILL = timedelta(days=365)
+BUDGETS_INTERVAL = timedelta(hours=1)
+# How long the last good accounts of a failing login stand in for it
+LOGIN_MAX_AGE = timedelta(days=1)
 HEADLESS = False
 
-SENSOR_TYPES = {
-    ATTR_INVESTMENT: ['INVESTMENT', 'Investment', False],
-    ATTR_MORTGAGE: ['MORTGAGE', 'Mortgage', True],
-    ATTR_CASH: ['BANK', 'Cash', False],
-    ATTR_OTHER_ASSET: ['OTHER_ASSETS', 'Other Asset', False],
-    ATTR_CREDIT: ['CREDIT_CARD', 'Credit', True],
-    ATTR_LOAN: ['LOAN', 'Loan', True],
-    ATTR_VEHICLE: ['VEHICLE', 'Vehicle', False],
-    ATTR_REAL_ESTATE: ['REAL_ESTATE', 'Real Estate', False],
-}
-
-ASSET_ACCOUNT_TYPES = [ATTR_INVESTMENT, ATTR_CASH, ATTR_OTHER_ASSET, ATTR_VEHICLE, ATTR_REAL_ESTATE]
-LIABILITY_ACCOUNT_TYPES = [ATTR_MORTGAGE, ATTR_CREDIT, ATTR_LOAN]
-
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
+
+def compile_currency_overrides(account_currency_overrides):
+    """Flatten the account_currency_override config into {account id: currency}."""
+    currency_by_account = {}
+    for account_currency in account_currency_overrides or []:
+        for currency, override_accounts in account_currency.items():
+            for override_account in override_accounts:
+                existing = currency_by_account.get(override_account)
+                if existing is not None and existing != currency:
+                    raise vol.Invalid('Account {} is overridden as both {} and {}'.format(
+                        override_account, existing, currency))
+                currency_by_account[override_account] = currency
+    return currency_by_account
+
+
+def _validate_currency_overrides(value):
+    """Reject configs that put the same account under two currencies."""
+    compile_currency_overrides(value)
+    return value
+
+
+LOGIN_SCHEMA = vol.Schema({
     vol.Required(CONF_USERNAME): cv.string,
     vol.Required(CONF_PASSWORD): cv.string,
+    vol.Optional(CONF_SESSION_PATH): cv.string,
+})
+
+PLATFORM_SCHEMA = vol.All(PLATFORM_SCHEMA.extend({
+    vol.Inclusive(CONF_USERNAME, 'credentials'): cv.string,
+    vol.Inclusive(CONF_PASSWORD, 'credentials'): cv.string,
+    vol.Optional(CONF_LOGINS): vol.All(cv.ensure_list, [LOGIN_SCHEMA]),
+    vol.Optional(CONF_FETCH_WORKERS, default=2): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_LOGIN_MAX_AGE, default=LOGIN_MAX_AGE): cv.time_period,
     vol.Optional(CONF_UNIT_OF_MEASUREMENT, default='USD'): cv.string,
     vol.Optional(CONF_CATEGORIES, default=[]): vol.All(cv.ensure_list, [vol.In(SENSOR_TYPES)]),
     vol.Optional(CONF_EXCLUDE_ACCOUNTS):
@@ -74,7 +163,73 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
         vol.All(cv.ensure_list, [{
             cv.string :
                 vol.All(cv.ensure_list, [cv.positive_int])
-            }]),
+            }], _validate_currency_overrides),
+    vol.Optional(CONF_SESSION_PATH): cv.string,
+    vol.Optional(CONF_BACKEND, default=BACKEND_SELENIUM):
+        vol.In([BACKEND_SELENIUM, BACKEND_HTTP, BACKEND_FAKE]),
+    vol.Optional(CONF_FAKE_ACCOUNTS, default=100): cv.positive_int,
+    vol.Optional(CONF_FAKE_FIXTURE): cv.isfile,
+    vol.Optional(CONF_FAKE_LATENCY, default=timedelta(0)): cv.time_period,
+    vol.Optional(CONF_FAKE_FAILURE_RATE, default=0.0):
+        vol.All(vol.Coerce(float), vol.Range(min=0.0, max=1.0)),
+    vol.Optional(CONF_RETRY_ATTEMPTS, default=3): cv.positive_int,
+    vol.Optional(CONF_RETRY_BACKOFF, default=timedelta(seconds=5)): cv.time_period,
+    vol.Optional(CONF_RETRY_MAX_BACKOFF, default=timedelta(minutes=2)): cv.time_period,
+    vol.Optional(CONF_CIRCUIT_THRESHOLD, default=3): cv.positive_int,
+    vol.Optional(CONF_CIRCUIT_RESET, default=timedelta(minutes=15)): cv.time_period,
+    vol.Optional(CONF_HISTORY, default=True): cv.boolean,
+    vol.Optional(CONF_TRENDS, default=[]): vol.All(cv.ensure_list, [vol.In(METRICS)]),
+    vol.Optional(CONF_MAX_SCAN_INTERVAL, default=MAX_SCAN_INTERVAL): cv.time_period,
+    vol.Optional(CONF_SCAN_BACKOFF_FACTOR, default=SCAN_BACKOFF_FACTOR):
+        vol.All(vol.Coerce(float), vol.Range(min=1.0)),
+    vol.Optional(CONF_INSTITUTION_REFRESH_INTERVAL): cv.time_period,
+    vol.Optional(CONF_INSTITUTION_REFRESH_WINDOW, default=INSTITUTION_REFRESH_WINDOW): cv.time_period,
+    vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+    vol.Optional(CONF_ACCOUNT_SENSORS, default=False): cv.boolean,
+    vol.Optional(CONF_TRANSACTIONS, default=False): cv.boolean,
+    vol.Optional(CONF_TRANSACTIONS_INTERVAL, default=TRANSACTIONS_INTERVAL): cv.time_period,
+    vol.Optional(CONF_TRANSACTIONS_BACKFILL, default=TRANSACTIONS_BACKFILL): cv.time_period,
+    vol.Optional(CONF_SPENDING_CATEGORIES): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(CONF_BUDGETS, default=False): cv.boolean,
+    vol.Optional(CONF_BUDGETS_INTERVAL, default=BUDGETS_INTERVAL): cv.time_period,
+    vol.Optional(CONF_MONITORED_BUDGETS): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(CONF_BROWSER_MAX_MEMORY, default=BROWSER_MAX_MEMORY): cv.positive_int,
+    vol.Optional(CONF_BROWSER_MAX_AGE, default=timedelta(seconds=BROWSER_MAX_AGE)): cv.time_period,
+    vol.Optional(CONF_WORKER, default=False): cv.boolean,
+    vol.Optional(CONF_WORKER_TIMEOUT, default=timedelta(seconds=WORKER_TIMEOUT)): cv.time_period,
+    vol.Optional(CONF_WORKER_PERSIST, default=False): cv.boolean,
+}), cv.has_at_least_one_key(CONF_USERNAME, CONF_LOGINS))
+
+SERVICE_QUERY_HISTORY = 'query_balance_history'
+EVENT_HISTORY_RESULT = 'mint_finance_balance_history'
+ATTR_START = 'start'
+ATTR_END = 'end'
+ATTR_ACCOUNT_IDS = 'account_ids'
+ATTR_ROWS = 'rows'
+ATTR_TRUNCATED = 'truncated'
+# Rows one query event carries at most; the recorder keeps every event, and the whole
+# history of a few years of accounts would make one event of several megabytes
+MAX_QUERY_ROWS = 5000
+
+SERVICE_QUERY_TRANSACTIONS = 'query_transactions'
+EVENT_TRANSACTIONS_RESULT = 'mint_finance_transactions'
+ATTR_CATEGORY = 'category'
+
+SERVICE_DUMP_METRICS = 'dump_metrics'
+EVENT_METRICS_RESULT = 'mint_finance_metrics'
+ATTR_METRICS = 'metrics'
+ATTR_STATS = 'stats'
+
+QUERY_HISTORY_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_START): cv.datetime,
+    vol.Optional(ATTR_END): cv.datetime,
+    vol.Optional(ATTR_ACCOUNT_IDS): vol.All(cv.ensure_list, [cv.positive_int]),
+})
+
+QUERY_TRANSACTIONS_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_START): cv.date,
+    vol.Optional(ATTR_END): cv.date,
+    vol.Optional(ATTR_CATEGORY): cv.string,
 })
 
 _CONFIGURING = {}
@@ -82,121 +237,813 @@ _LOGGER = logging.getLogger(__name__)
 
 mint_client = None
 
-def setup_platform(hass, config, add_devices, discovery_info=None):
-    mint_client = MintClient(config)
+AccountSnapshot = namedtuple('AccountSnapshot', ['accounts', 'fetched_at', 'totals', 'stale', 'trends'])
+
+
+class MintUnavailable(Exception):
+    """Mint could not be reached and there is no earlier snapshot to serve."""
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    session_path = config.get(CONF_SESSION_PATH) or hass.config.path(SESSION_PATH)
+    history = BalanceHistory(hass.config.path(HISTORY_PATH)) if config.get(CONF_HISTORY, True) else None
+    metrics = Metrics() if config.get(CONF_DIAGNOSTICS) else NULL_METRICS
+    lazy.set_metrics(metrics)
+    transactions = None
+    if config.get(CONF_TRANSACTIONS):
+        transactions = TransactionSync(
+            TransactionStore(hass.config.path(TRANSACTIONS_PATH)),
+            config.get(CONF_TRANSACTIONS_BACKFILL, TRANSACTIONS_BACKFILL).days)
+    mint_client = MintClient(config, session_path, rates_path=hass.config.path(RATES_CACHE),
+                             cache=SnapshotCache(hass), history=history, metrics=metrics,
+                             transactions=transactions, worker_path=hass.config.path(WORKER_PATH))
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, mint_client.async_close)
+    # Come up from the last good snapshot; the first live fetch runs in the background
+    await mint_client.async_load_cache(hass)
+    store = mint_client.store
+    if store is not None:
+        hass.data[DATA_MINT] = store
     uom = config[CONF_UNIT_OF_MEASUREMENT]
     sensors = []
     categories = config[CONF_CATEGORIES] if len(config[CONF_CATEGORIES]) > 0 else SENSOR_TYPES.keys()
     sensors.append(MintNetWorthSensor(mint_client, config))
     for category in categories:
         sensors.append(MintCategorySensor(hass, mint_client, config, category))
-    add_devices(sensors, True)
+    if history is not None:
+        for metric in config.get(CONF_TRENDS, []):
+            sensors.append(MintTrendSensor(mint_client, config, ATTR_NETWORTH, metric))
+            for category in categories:
+                sensors.append(MintTrendSensor(mint_client, config, category, metric))
+    if metrics.enabled:
+        for stage in STAGES:
+            sensors.append(MintStageTimeSensor(mint_client, stage))
+        sensors.append(MintDiagnosticsSensor(mint_client))
+    if store is not None:
+        account_sensors = {}
+
+        @callback
+        def async_update_account_sensors(changed=None):
+            """Add sensors for accounts that appeared and remove those of closed accounts."""
+            if changed is not None and ATTR_ACCOUNTS not in changed:
+                return []
+            new_sensors = []
+            for account_id in store.accounts:
+                if account_id not in account_sensors:
+                    account_sensors[account_id] = MintAccountSensor(mint_client, config, account_id)
+                    new_sensors.append(account_sensors[account_id])
+            for account_id in [account_id for account_id in account_sensors if account_id not in store]:
+                hass.async_create_task(account_sensors.pop(account_id).async_remove())
+            if changed is not None and new_sensors:
+                async_add_entities(new_sensors, True)
+            return new_sensors
+
+        sensors.extend(async_update_account_sensors())
+        mint_client.async_add_listener(async_update_account_sensors)
+    if transactions is not None:
+        spending_categories = config.get(CONF_SPENDING_CATEGORIES)
+        spending_sensors = {}
+
+        @callback
+        def async_update_spending_sensors(changed=None):
+            """Add a spending sensor for every monitored category, or every category seen so far."""
+            if changed is not None and ATTR_SPENDING not in changed:
+                return []
+            new_sensors = []
+            for category in spending_categories or mint_client.spending:
+                if category not in spending_sensors:
+                    spending_sensors[category] = MintSpendingSensor(mint_client, config, category)
+                    new_sensors.append(spending_sensors[category])
+            if changed is not None and new_sensors:
+                async_add_entities(new_sensors, True)
+            return new_sensors
+
+        sensors.extend(async_update_spending_sensors())
+        mint_client.async_add_listener(async_update_spending_sensors)
+    budgets = mint_client.budgets
+    if budgets is not None:
+        monitored_budgets = config.get(CONF_MONITORED_BUDGETS)
+        budget_sensors = {}
+
+        @callback
+        def async_update_budget_sensors(changed=None):
+            """Add sensors for budgets that appeared and remove those of deleted budgets."""
+            if changed is not None and ATTR_BUDGETS not in changed:
+                return []
+            new_sensors = []
+            for category in budgets.budgets:
+                if category not in budget_sensors and (not monitored_budgets or category in monitored_budgets):
+                    budget_sensors[category] = MintBudgetSensor(mint_client, config, category)
+                    new_sensors.append(budget_sensors[category])
+            for category in [category for category in budget_sensors if category not in budgets]:
+                hass.async_create_task(budget_sensors.pop(category).async_remove())
+            if changed is not None and new_sensors:
+                async_add_entities(new_sensors, True)
+            return new_sensors
+
+        mint_client.async_add_listener(async_update_budget_sensors)
+    async_add_entities(sensors, True)
+    mint_client.async_start(hass)
+
+    if history is not None:
+        async def async_query_history(call):
+            """Fire an event with the balance history rows matching the call."""
+            start = call.data.get(ATTR_START)
+            end = call.data.get(ATTR_END)
+            rows = await hass.async_add_executor_job(
+                history.query,
+                start.timestamp() if start else None,
+                end.timestamp() if end else None,
+                call.data.get(ATTR_ACCOUNT_IDS),
+                MAX_QUERY_ROWS + 1)
+            hass.bus.async_fire(EVENT_HISTORY_RESULT, {
+                ATTR_ROWS: rows[:MAX_QUERY_ROWS],
+                ATTR_TRUNCATED: len(rows) > MAX_QUERY_ROWS,
+            })
+
+        hass.services.async_register(
+            DOMAIN, SERVICE_QUERY_HISTORY, async_query_history, schema=QUERY_HISTORY_SCHEMA)
+
+    if transactions is not None:
+        async def async_query_transactions(call):
+            """Fire an event with the synced transactions matching the call."""
+            start = call.data.get(ATTR_START)
+            end = call.data.get(ATTR_END)
+            rows = await hass.async_add_executor_job(
+                transactions.store.query,
+                start.isoformat() if start else None,
+                end.isoformat() if end else None,
+                call.data.get(ATTR_CATEGORY),
+                MAX_QUERY_ROWS + 1)
+            hass.bus.async_fire(EVENT_TRANSACTIONS_RESULT, {
+                ATTR_ROWS: rows[:MAX_QUERY_ROWS],
+                ATTR_TRUNCATED: len(rows) > MAX_QUERY_ROWS,
+            })
+
+        hass.services.async_register(
+            DOMAIN, SERVICE_QUERY_TRANSACTIONS, async_query_transactions, schema=QUERY_TRANSACTIONS_SCHEMA)
+
+    if metrics.enabled:
+        async def async_dump_metrics(call):
+            """Fire an event with every stage timing, counter and client stat."""
+            hass.bus.async_fire(EVENT_METRICS_RESULT, {
+                ATTR_METRICS: metrics.dump(),
+                ATTR_STATS: mint_client.stats,
+            })
+
+        hass.services.async_register(DOMAIN, SERVICE_DUMP_METRICS, async_dump_metrics)
+
+
+def configured_logins(config, session_path=SESSION_PATH):
+    """Return a {username, password, session_path} dict for every configured Mint login.
+
+    A lone login keeps session_path itself, so an existing session survives
+    adding the logins option. With several, each login that does not set its
+    own session_path gets a directory next to it named after the username.
+    """
+    logins = []
+    if config.get(CONF_USERNAME):
+        logins.append({CONF_USERNAME: config[CONF_USERNAME], CONF_PASSWORD: config[CONF_PASSWORD]})
+    logins.extend(config.get(CONF_LOGINS) or [])
+    return [{
+        CONF_USERNAME: login[CONF_USERNAME],
+        CONF_PASSWORD: login[CONF_PASSWORD],
+        CONF_SESSION_PATH: login.get(CONF_SESSION_PATH) or (
+            session_path if len(logins) == 1 else '{}-{}'.format(session_path, slugify(login[CONF_USERNAME]))),
+    } for login in logins]
+
+
+def backend_spec(config, login, index=0):
+    """Return the plain data build_backend needs to make one login's backend."""
+    return {
+        'backend': config.get(CONF_BACKEND, BACKEND_SELENIUM),
+        'username': login[CONF_USERNAME],
+        'password': login[CONF_PASSWORD],
+        'session_path': login[CONF_SESSION_PATH],
+        'headless': HEADLESS,
+        'seed': index,
+        'fake_accounts': config.get(CONF_FAKE_ACCOUNTS, 100),
+        'fake_fixture': config.get(CONF_FAKE_FIXTURE),
+        'fake_latency': config.get(CONF_FAKE_LATENCY, timedelta(0)).total_seconds(),
+        'fake_failure_rate': config.get(CONF_FAKE_FAILURE_RATE, 0.0),
+        'transactions': config.get(CONF_TRANSACTIONS, False),
+        'budgets': config.get(CONF_BUDGETS, False),
+        'browser_max_memory': config.get(CONF_BROWSER_MAX_MEMORY, BROWSER_MAX_MEMORY),
+        'browser_max_age': config.get(CONF_BROWSER_MAX_AGE, timedelta(seconds=BROWSER_MAX_AGE)).total_seconds(),
+    }
+
+
+def create_backend(config, login, index=0, metrics=NULL_METRICS, worker_path=WORKER_PATH):
+    """Build the MintBackend selected by the backend option for one login.
+
+    With the worker option it runs in the worker process listening on worker_path.
+    """
+    spec = backend_spec(config, login, index)
+    if config.get(CONF_WORKER):
+        return RemoteBackend(
+            spec, worker_path,
+            timeout=config.get(CONF_WORKER_TIMEOUT, timedelta(seconds=WORKER_TIMEOUT)).total_seconds(),
+            persist=config.get(CONF_WORKER_PERSIST, False))
+    return build_backend(spec, metrics)
 
 
 class MintClient(Entity):
 
-    def __init__(self, config):
-        self.mint_client = None
+    def __init__(self, config, session_path=SESSION_PATH, rates_path=RATES_CACHE, cache=None,
+                 history=None, metrics=NULL_METRICS, transactions=None, worker_path=WORKER_PATH):
         self.config = config
-        self.mint_client = self.getMintClient()
+        self.metrics = metrics
+        self._created = time.perf_counter()
+        self._first_update_recorded = False
+        self.store = AccountStore() if config.get(CONF_ACCOUNT_SENSORS) else None
+        self.transactions = transactions
+        # Month-to-date spending by Mint category
+        self.spending = {}
+        self.budgets = BudgetStore() if config.get(CONF_BUDGETS) else None
+        self._unsub_intervals = []
+        self.cache = cache
+        self.history = history
+        # Every account ever seen per category, so trends keep the history
+        # of accounts that have since been closed
+        self._category_accounts = dict((sensor_type, set()) for sensor_type in SENSOR_TYPES)
+        self.backends = [
+            create_backend(config, login, index, metrics, worker_path)
+            for index, login in enumerate(configured_logins(config, session_path))]
+        # Last good accounts per login and when they were fetched, standing
+        # in for a login whose fetch fails for up to login_max_age
+        self._login_accounts = {}
+        self._login_fetched_at = {}
+        self._login_max_age = config.get(CONF_LOGIN_MAX_AGE, LOGIN_MAX_AGE).total_seconds()
+        # Logins the last snapshot took from _login_accounts
+        self._failing_logins = frozenset()
+        # Browser sessions in this process; the fake and worker backends have none
+        self.sessions = [backend.session for backend in self.backends if getattr(backend, 'session', None)]
+        self.watchdog = None
+        if self.sessions:
+            self.watchdog = BrowserWatchdog(
+                config.get(CONF_BROWSER_MAX_MEMORY, BROWSER_MAX_MEMORY),
+                config.get(CONF_BROWSER_MAX_AGE, timedelta(seconds=BROWSER_MAX_AGE)).total_seconds(),
+                metrics)
+        self.retry_policy = RetryPolicy(
+            attempts=config.get(CONF_RETRY_ATTEMPTS, 3),
+            backoff=config.get(CONF_RETRY_BACKOFF, timedelta(seconds=5)).total_seconds(),
+            max_backoff=config.get(CONF_RETRY_MAX_BACKOFF, timedelta(minutes=2)).total_seconds())
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=config.get(CONF_CIRCUIT_THRESHOLD, 3),
+            reset_timeout=config.get(CONF_CIRCUIT_RESET, timedelta(minutes=15)).total_seconds())
+        self.currency_overrides = compile_currency_overrides(config.get(CONF_ACCOUNT_CURRENCY_OVERRIDE))
+        self.excluded_accounts = frozenset(config.get(CONF_EXCLUDE_ACCOUNTS) or [])
+        self.rates = None
+        if self.currency_overrides:
+            self.rates = get_currency_rates(rates_path)
+        min_interval = config.get(CONF_SCAN_INTERVAL, SCAN_INTERVAL).total_seconds()
+        institution_refresh_interval = config.get(CONF_INSTITUTION_REFRESH_INTERVAL)
+        self.scheduler = RefreshScheduler(
+            min_interval,
+            config.get(CONF_MAX_SCAN_INTERVAL, MAX_SCAN_INTERVAL).total_seconds(),
+            config.get(CONF_SCAN_BACKOFF_FACTOR, SCAN_BACKOFF_FACTOR),
+            institution_refresh_interval.total_seconds() if institution_refresh_interval else None,
+            config.get(CONF_INSTITUTION_REFRESH_WINDOW, INSTITUTION_REFRESH_WINDOW).total_seconds())
+        # Snapshots younger than this are shared by every caller in the same cycle
+        self._snapshot_max_age = min_interval / 2
+        self._snapshot = None
+        self._last_attempt = None
+        self._last_error = None
+        self._snapshot_lock = threading.Lock()
+        # Every blocking mintapi call runs on this single worker, so a slow
+        # Mint login never holds more than one thread.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # With several logins, that worker fans their fetches out over a
+        # pool capped at fetch_workers browsers
+        self._fetch_executor = None
+        if len(self.backends) > 1:
+            self._fetch_executor = ThreadPoolExecutor(
+                max_workers=min(config.get(CONF_FETCH_WORKERS, 2), len(self.backends)))
+        self._refresh_task = None
+        self._listeners = []
+        self._published_snapshot = None
+        self._published_stats = None
+        self._unsub_refresh = None
+        # Set by async_close, so a refresh still running does not schedule another
+        self._closing = False
+
+    def _get_login_accounts(self, backend):
+        def on_retry(exp, attempt):
+            self.metrics.increment(COUNTER_RETRIES)
+            backend.invalidate()
+
+        return self.retry_policy.call(backend.get_accounts, retry_on=BackendError, on_retry=on_retry)
+
+    def get_accounts(self):
+        """Fetch every login and return one list of mintapi accounts per login.
 
-    def getMintClient(self, new_session=True):
-        from mintapi import Mint
-        from mintapi.api import MintException
+        Logins are fetched in parallel. An entry is None when that login
+        failed; the first error is raised instead when every login failed.
+        """
+        with self.metrics.timer(STAGE_FETCH):
+            if self._fetch_executor is None:
+                return [self._get_login_accounts(backend) for backend in self.backends]
+            futures = [self._fetch_executor.submit(self._get_login_accounts, backend)
+                       for backend in self.backends]
+            accounts_by_login = []
+            errors = []
+            for index, future in enumerate(futures):
+                try:
+                    accounts_by_login.append(future.result())
+                except Exception as exp:  # pylint: disable=broad-except
+                    _LOGGER.warning('Error fetching mint login %s: %s', index + 1, exp)
+                    accounts_by_login.append(None)
+                    errors.append(exp)
+            if len(errors) == len(futures):
+                raise errors[0]
+            return accounts_by_login
 
-        username = self.config.get(CONF_USERNAME)
-        password = self.config.get(CONF_PASSWORD)
+    def _merge_logins(self, accounts_by_login, fetched_at):
+        """Normalize and merge each login's accounts, reusing the last good ones for failed logins.
 
+        The last good accounts of a login are only reused while they are
+        younger than login_max_age; after that the whole fetch fails.
+        """
+        normalized = []
+        failing = set()
+        for index, accounts in enumerate(accounts_by_login):
+            if accounts is None:
+                # Leaving the login out would look like its accounts closed
+                if index not in self._login_accounts:
+                    raise BackendError('Mint login {} failed and has no earlier accounts'.format(index + 1))
+                if fetched_at - self._login_fetched_at[index] > self._login_max_age:
+                    raise BackendError('Mint login {} has failed since {}'.format(
+                        index + 1, datetime.fromtimestamp(self._login_fetched_at[index]).isoformat()))
+                normalized.append(self._login_accounts[index])
+                failing.add(index)
+            else:
+                normalized.append(tuple(normalize_account(account) for account in accounts))
+        for index, accounts in enumerate(normalized):
+            if index not in failing:
+                self._login_accounts[index] = accounts
+                self._login_fetched_at[index] = fetched_at
+        self._failing_logins = frozenset(failing)
+        if len(normalized) == 1:
+            return normalized[0]
+        return merge_accounts(normalized)
+
+    def initiate_account_refresh(self):
+        """Ask Mint to pull fresh data from every institution."""
+        if not self.circuit_breaker.allow_request():
+            return
+        failed = 0
+        for backend in self.backends:
+            try:
+                backend.initiate_account_refresh()
+            except BackendError as exp:
+                _LOGGER.warning('Error initiating mint account refresh: %s', exp)
+                backend.invalidate()
+                failed += 1
+        self._record_logins(failed)
+
+    def _record_logins(self, failed):
+        """Tell the circuit breaker how a call to every login went; it failed when `failed` logins all did."""
+        if failed == len(self.backends):
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+    def get_snapshot(self):
+        """Return the shared accounts snapshot, fetching it at most once per cycle.
+
+        Callers arriving while a fetch is in flight block on the lock and
+        get the snapshot that fetch publishes instead of starting their own.
+        When the fetch fails, or the circuit is open, the last good snapshot
+        is served instead.
+        """
+        with self._snapshot_lock:
+            if not self._snapshot_is_fresh():
+                self._refresh_snapshot()
+            else:
+                self.metrics.increment(COUNTER_SNAPSHOT_HITS)
+            if self._snapshot is None:
+                raise MintUnavailable(self._last_error or 'Mint circuit is open')
+            return self._snapshot
+
+    def _refresh_snapshot(self):
+        if not self.circuit_breaker.allow_request():
+            _LOGGER.debug('Mint circuit is open, serving the last snapshot')
+            self.metrics.increment(COUNTER_CIRCUIT_REJECTIONS)
+            return
+        started = time.time()
+        self._last_attempt = started
+        self.metrics.increment(COUNTER_FETCHES)
         try:
-            # Init Mint client
-            if new_session and self.mint_client:
-                self.mint_client.close()
-
-            mint_client = Mint(username,
-                password,
-                session_path=SESSION_PATH,
-                # wait_for_sync=False,
-                headless=HEADLESS)
-            return mint_client
-        except  MintException as exp:
-            _LOGGER.error('Error occured while getting mint client')
+            accounts_by_login = self.get_accounts()
+            with self.metrics.timer(STAGE_NORMALIZE):
+                accounts = self._merge_logins(accounts_by_login, started)
+        except Exception as exp:  # pylint: disable=broad-except
+            self.metrics.increment(COUNTER_FETCH_FAILURES)
+            self.circuit_breaker.record_failure()
+            self._last_error = 'Error fetching mint accounts: {}'.format(exp)
+            _LOGGER.error(self._last_error)
+            return
+        self.circuit_breaker.record_success()
+        self._last_error = None
+        # Partly made of a failed login's earlier accounts
+        self._publish(accounts, started, stale=bool(self._failing_logins))
 
-    def get_accounts(self):
-        from mintapi import Mint
-        from mintapi.api import MintException
+    def _publish(self, accounts, fetched_at, stale=False):
+        if self.rates is not None:
+            self.rates.refresh_if_due()
+        with self.metrics.timer(STAGE_AGGREGATE):
+            totals = aggregate_accounts(
+                accounts,
+                self.config.get(CONF_UNIT_OF_MEASUREMENT, 'USD'),
+                self.currency_overrides,
+                self.rates,
+                self.excluded_accounts,
+                previous=self._snapshot.totals if self._snapshot is not None else None,
+                metrics=self.metrics)
+        trends = self._snapshot.trends if self._snapshot is not None else None
+        if self.history is not None and not stale:
+            with self.metrics.timer(STAGE_HISTORY):
+                try:
+                    self.history.append(fetched_at, dict(
+                        (row['id'], row['balance'])
+                        for category in totals.categories.values()
+                        for row in category.accounts))
+                except OSError as exp:
+                    # A full disk must not keep the fetched totals from the sensors
+                    _LOGGER.error('Could not record the mint balance history: %s', exp)
+                if self.config.get(CONF_TRENDS):
+                    try:
+                        trends = self._compute_trends(totals, fetched_at)
+                    except Exception as exp:  # pylint: disable=broad-except
+                        # NumPy missing or a bad history: the trend sensors keep their last values
+                        _LOGGER.error('Could not compute mint trends: %s', exp)
+        self._snapshot = AccountSnapshot(accounts, fetched_at, totals, stale, trends)
+
+    def _compute_trends(self, totals, now):
+        series = {ATTR_NETWORTH: None}
+        for sensor_type, account_ids in self._category_accounts.items():
+            account_ids.update(row['id'] for row in totals.categories[sensor_type].accounts)
+            series[sensor_type] = account_ids
+        return compute_trends(self.history, series, now, time.localtime(now).tm_gmtoff)
+
+    @property
+    def snapshot(self):
+        """Return the last published snapshot, or None before the first one."""
+        return self._published_snapshot
+
+    async def async_load_cache(self, hass):
+        """Publish the cached snapshot, marked stale, if there is one."""
+        if self.cache is None:
+            return
+        cached = await self.cache.async_load()
+        if cached is None:
+            return
+        accounts, fetched_at = cached
+        _LOGGER.info('Starting from cached mint snapshot with %s accounts', len(accounts))
+        # Totals may need currency rates, which load from disk
+        await hass.loop.run_in_executor(self._executor, self._publish, accounts, fetched_at, True)
+        self._published_snapshot = self._snapshot
+        if self.store is not None:
+            self.store.update(self._snapshot.totals.categories, True)
+
+    def _snapshot_is_fresh(self):
+        """Return True when the current cycle already fetched, even unsuccessfully."""
+        if self._last_attempt is None:
+            return False
+        return time.time() - self._last_attempt < self._snapshot_max_age
+
+    @property
+    def stats(self):
+        """Return backend, retry, circuit breaker and browser watchdog state for attributes.
+
+        Backend counters are summed over the logins.
+        """
+        stats = {ATTR_LOGINS: len(self.backends), ATTR_FAILING_LOGINS: len(self._failing_logins)}
+        for backend in self.backends:
+            for key, value in backend.stats.items():
+                stats[key] = stats.get(key, 0) + value
+        stats.update(self.circuit_breaker.stats)
+        stats[ATTR_RETRIES] = self.retry_policy.retry_count
+        if self.watchdog is not None:
+            stats.update(self.watchdog.stats)
+        return stats
+
+    @property
+    def state_stats(self):
+        """Return the STATE_STATS part of stats, for the net worth attributes."""
+        stats = self.stats
+        return dict((key, stats[key]) for key in STATE_STATS if key in stats)
+
+    async def async_get_snapshot(self, hass):
+        """Return the shared snapshot without blocking the event loop.
+
+        A single background task owns the refresh; every entity awaits the
+        same future while it is in flight.
+        """
+        if self._snapshot_is_fresh() and self._snapshot is not None:
+            return self._snapshot
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = hass.async_create_task(self._async_refresh(hass))
+        return await asyncio.shield(self._refresh_task)
+
+    async def _async_refresh(self, hass):
+        return await hass.loop.run_in_executor(self._executor, self.get_snapshot)
+
+    def _load_dependencies(self):
+        """Import the heavy modules this configuration uses, off the event loop."""
+        backend = self.config.get(CONF_BACKEND, BACKEND_SELENIUM)
+        modules = []
+        # The worker process imports the backend's modules itself
+        if not self.config.get(CONF_WORKER):
+            if backend != BACKEND_FAKE:
+                modules.extend([lazy.mintapi, lazy.mintapi_api])
+            if backend == BACKEND_HTTP:
+                modules.extend([lazy.requests, lazy.requests_adapters])
+        if self.history is not None and self.config.get(CONF_TRENDS):
+            modules.append(lazy.numpy)
+        for module in modules:
+            try:
+                module.load()
+            except ImportError as exp:
+                # The first fetch that needs it reports the error
+                _LOGGER.error('Could not import %s: %s', module.name, exp)
+        if self.watchdog is not None:
+            self._reap_orphans()
+
+    def _reap_orphans(self):
+        """Kill browsers an earlier run left on our session directories, before the first login."""
+        try:
+            self.watchdog.reap_orphans([session.session_path for session in self.sessions])
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning('Could not look for orphaned mint browser processes', exc_info=True)
+
+    def watch_browsers(self):
+        """Recycle browsers over their memory or age limit; only runs between fetch cycles."""
+        try:
+            self.watchdog.watch(self.sessions)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning('Could not check the mint browser processes', exc_info=True)
+
+    @callback
+    def async_start(self, hass):
+        """Start the refresh schedule, beginning with an immediate fetch.
+
+        The worker imports the heavy dependencies first, so the import cost
+        stays off the event loop and out of the login and fetch timings.
+        """
+        self.hass = hass
+        hass.loop.run_in_executor(self._executor, self._load_dependencies)
+        self._unsub_refresh = async_call_later(hass, 0, self._async_scheduled_refresh)
+        # Both are queued on the worker behind the first account fetch, and
+        # share its backends, so they never log in on their own
+        if self.transactions is not None:
+            self._async_track(self._async_sync_transactions,
+                              self.config.get(CONF_TRANSACTIONS_INTERVAL, TRANSACTIONS_INTERVAL))
+        if self.budgets is not None:
+            self._async_track(self._async_refresh_budgets, self.config.get(CONF_BUDGETS_INTERVAL, BUDGETS_INTERVAL))
 
+    def _async_track(self, action, interval):
+        """Run action now, then every interval until shutdown."""
+        self.hass.async_create_task(action())
+        self._unsub_intervals.append(async_track_time_interval(self.hass, action, interval))
+
+    async def _async_scheduled_refresh(self, now=None):
+        self._unsub_refresh = None
+        try:
+            if self.scheduler.institution_refresh_due(time.time()):
+                _LOGGER.info('Initiating mint account refresh')
+                await self.hass.loop.run_in_executor(self._executor, self.initiate_account_refresh)
+                self.scheduler.record_institution_refresh(time.time())
+            await self.async_refresh()
+            if self.watchdog is not None:
+                # Queued on the worker, so no fetch or sync is using the browser
+                await self.hass.loop.run_in_executor(self._executor, self.watch_browsers)
+        finally:
+            if not self._closing:
+                self._unsub_refresh = async_call_later(
+                    self.hass, self.scheduler.next_delay(time.time()), self._async_scheduled_refresh)
+
+    @callback
+    def async_add_listener(self, update_callback):
+        """Register update_callback(changed_keys); return a function that removes it."""
+        self._listeners.append(update_callback)
+        return lambda: self._listeners.remove(update_callback)
+
+    async def async_refresh(self, now=None):
+        """Refresh the snapshot and notify listeners about what changed.
+
+        Keys are SENSOR_TYPES entries whose totals changed, plus
+        ATTR_NETWORTH when the overall totals or the client's state stats did, plus
+        ATTR_DIAGNOSTICS on every cycle while diagnostics are on. With
+        account sensors on, the ids of accounts whose rows changed are keys
+        too, and ATTR_ACCOUNTS is one when accounts appeared or went away.
+        Going from the cached to a live snapshot changes every key.
+        Listeners are not called at all when nothing changed.
+        """
         try:
-            return self.mint_client.get_accounts()
-        except  MintException as exp:
-            self.mint_client = self.getMintClient(new_session=True)
-            return self.get_accounts()
+            snapshot = await self.async_get_snapshot(self.hass)
+        except MintUnavailable as exp:
+            _LOGGER.warning(exp)
+            snapshot = self._snapshot
+
+        with self.metrics.timer(STAGE_PUBLISH):
+            changed = set()
+            previous = self._published_snapshot
+            if snapshot is not None and snapshot is not previous:
+                stale_changed = previous is not None and previous.stale != snapshot.stale
+                for sensor_type, category in snapshot.totals.categories.items():
+                    if (stale_changed or previous is None
+                            or previous.totals.categories.get(sensor_type) is not category):
+                        changed.add(sensor_type)
+                if previous is not None:
+                    # A category whose last account went away is missing from the new totals
+                    changed.update(set(previous.totals.categories).difference(snapshot.totals.categories))
+                if self.store is not None:
+                    account_changes, accounts_changed = self.store.update(
+                        snapshot.totals.categories, snapshot.stale, set(changed))
+                    changed.update(account_changes)
+                    if accounts_changed:
+                        changed.add(ATTR_ACCOUNTS)
+                if stale_changed or previous is None or snapshot.totals[:3] != previous.totals[:3]:
+                    changed.add(ATTR_NETWORTH)
+                if snapshot.trends != (previous.trends if previous is not None else None):
+                    changed.add(ATTR_TRENDS)
+            stats = self.state_stats
+            if stats != self._published_stats:
+                changed.add(ATTR_NETWORTH)
+
+            self._published_snapshot = snapshot
+            self._published_stats = stats
+            if snapshot is not None and snapshot is not previous and not snapshot.stale:
+                if not self._first_update_recorded:
+                    self.metrics.record(STAGE_FIRST_UPDATE, time.perf_counter() - self._created)
+                    self._first_update_recorded = True
+                self.scheduler.record_snapshot(snapshot.accounts)
+                # Most cycles fetch the same accounts; rewriting the cache for them is wasted IO
+                if self.cache is not None and (previous is None or snapshot.accounts != previous.accounts):
+                    await self.cache.async_save(snapshot.accounts, snapshot.fetched_at)
+            if not changed:
+                _LOGGER.debug('Mint accounts unchanged, skipping state updates')
+                self.metrics.increment(COUNTER_UNCHANGED_CYCLES)
+            if self.metrics.enabled:
+                # Timings move every cycle
+                changed.add(ATTR_DIAGNOSTICS)
+            self._notify(changed)
+
+    @callback
+    def _notify(self, changed):
+        if not changed:
+            return
+        for update_callback in list(self._listeners):
+            update_callback(changed)
+
+    def _call_logins(self, action, description):
+        """Call action(login index, backend) for every login in turn, with retries.
+
+        Returns the results in login order, None for a login that failed.
+        The outcome goes to the circuit breaker.
+        """
+        results = []
+        for login, backend in enumerate(self.backends):
+            def on_retry(exp, attempt):
+                self.metrics.increment(COUNTER_RETRIES)
+                backend.invalidate()
+
+            try:
+                results.append(self.retry_policy.call(
+                    lambda: action(login, backend), retry_on=BackendError, on_retry=on_retry))
+            except BackendError as exp:
+                _LOGGER.warning('Error %s for login %s: %s', description, login + 1, exp)
+                results.append(None)
+        self._record_logins(results.count(None))
+        return results
+
+    def sync_transactions(self):
+        """Sync every login's new transactions and return this month's spending by category."""
+        if self.circuit_breaker.allow_request():
+            with self.metrics.timer(STAGE_TRANSACTIONS):
+                self._call_logins(self.transactions.sync, 'syncing mint transactions')
+        else:
+            _LOGGER.debug('Mint circuit is open, skipping the transaction sync')
+        return self.transactions.store.month_spending(time.strftime('%Y-%m'))
+
+    def get_budgets(self):
+        """Return {category: MintBudget} for every login, or None when any login's fetch failed."""
+        if not self.circuit_breaker.allow_request():
+            _LOGGER.debug('Mint circuit is open, skipping the budget fetch')
+            return None
+        with self.metrics.timer(STAGE_BUDGETS):
+            budgets_by_login = self._call_logins(
+                lambda login, backend: [normalize_budget(budget) for budget in backend.get_budgets()],
+                'fetching mint budgets')
+            if None in budgets_by_login:
+                # A partial set would make the missing login's budgets disappear
+                return None
+            return merge_budgets(budgets_by_login)
+
+    async def _async_refresh_budgets(self, now=None):
+        budgets = await self.hass.loop.run_in_executor(self._executor, self.get_budgets)
+        if budgets is None:
+            return
+        changed, membership_changed = self.budgets.update(budgets)
+        changed = set((ATTR_BUDGETS, category) for category in changed)
+        if membership_changed:
+            changed.add(ATTR_BUDGETS)
+        self._notify(changed)
+
+    async def _async_sync_transactions(self, now=None):
+        spending = await self.hass.loop.run_in_executor(self._executor, self.sync_transactions)
+        if spending != self.spending:
+            self.spending = spending
+            self._notify({ATTR_SPENDING})
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+        if self.transactions is not None:
+            self.transactions.store.close()
+
+    async def async_close(self, event=None):
+        """Close the browser and stop the worker on shutdown."""
+        self._closing = True
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
+        while self._unsub_intervals:
+            self._unsub_intervals.pop()()
+        await asyncio.get_event_loop().run_in_executor(self._executor, self.close)
+        self._executor.shutdown(wait=False)
+        if self._fetch_executor is not None:
+            self._fetch_executor.shutdown(wait=False)
+
+
+class MintEntity(Entity):
+    """Base of the Mint sensors, updated when MintClient pushes a change they want."""
 
-class MintNetWorthSensor(Entity):
+    def __init__(self, mint_client):
+        """Initialize the sensor."""
+        self._mint_client = mint_client
+        self._unsub_listener = None
+
+    @property
+    def should_poll(self):
+        """MintClient pushes changes, no polling needed."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Subscribe to MintClient's changes."""
+        self._unsub_listener = self._mint_client.async_add_listener(self._handle_changes)
+
+    async def async_will_remove_from_hass(self):
+        """Unsubscribe from MintClient's changes."""
+        if self._unsub_listener is not None:
+            self._unsub_listener()
+            self._unsub_listener = None
+
+    def _wants(self, changed):
+        """Return whether the keys MintClient reports as changed concern this sensor."""
+        raise NotImplementedError
+
+    @callback
+    def _handle_changes(self, changed):
+        if self._wants(changed):
+            self.async_schedule_update_ha_state(True)
+
+
+class MintNetWorthSensor(MintEntity):
     """Representation of a personalcapital.com net worth sensor."""
-    last_used = time.time() - MIN_TIME_BETWEEN_UPDATES
 
     def __init__(self, mint_client, config):
         """Initialize the sensor."""
-        self._mint_client = mint_client
+        super().__init__(mint_client)
         self._unit_of_measurement = config[CONF_UNIT_OF_MEASUREMENT]
         self._config = config
         self._state = None
         self._assets = None
         self._liabilities = None
-        self.update()
+        self._stale = None
+
+    def _wants(self, changed):
+        return ATTR_NETWORTH in changed
 
-    @Throttle(SCAN_INTERVAL)
-    def update(self):
+    async def async_update(self):
         """Get the latest state of the sensor."""
         _LOGGER.info('Updating mint networth')
-        # self._mint_client.initiate_account_refresh()
-
-        # next_update = MintNetWorthSensor.last_used + MIN_TIME_BETWEEN_UPDATES
-        # _LOGGER.info('Last used: {}, Time since: {}'.format(MintNetWorthSensor.last_used, time.time() - MintNetWorthSensor.last_used))
-        # if self._mint_client and self._mint_client.driver and time.time() < next_update:
-        data = self._mint_client.get_accounts()
-        # if time.time() > next_update:
-
-        MintNetWorthSensor.last_used = time.time()
-        active_accounts = [account for account in data if account['isActive'] == True and account['isAccountNotFound'] == False and account['isClosed'] == False]
-        asset_accounts = [account for account in data if account['isActive'] == True and account['isAccountNotFound'] == False and account['isClosed'] == False and account['accountType'] in ASSET_ACCOUNT_TYPES]
-        liability_accounts = [account for account in data if account['isActive'] == True and account['isAccountNotFound'] == False and account['isClosed'] == False and account['accountType'] in LIABILITY_ACCOUNT_TYPES]
-
-        account_currency_overrides = self._config.get(CONF_ACCOUNT_CURRENCY_OVERRIDE)
-
-        # Format +/- balance according to it's accountType
-        for active_account in active_accounts:
-            active_account['currentBalance'] = format_balance(SENSOR_TYPES[active_account['accountType']][2], active_account['currentBalance'])
-
-        if account_currency_overrides:
-            from currency_converter import CurrencyConverter
-            converter = CurrencyConverter()
-
-            # _LOGGER.info('Account currency overrides: {}'.format(json.dumps(account_currency_overrides)))
-            for account_currency in account_currency_overrides:
-                for currency in account_currency.keys():
-                    override_accounts = account_currency[currency]
-                    _LOGGER.info("{}-{}".format(currency, override_accounts))
-                    for override_account in override_accounts:
-                        for active_account in active_accounts:
-                            if active_account['id'] == override_account:
-                                converted_balance = round(converter.convert(active_account['currentBalance'], currency, self._unit_of_measurement))
-                                # _LOGGER.info('Account - {}: Converting {} {} to {} {}'.format(override_account, currency, active_account['currentBalance'], self._unit_of_measurement, converted_balance))
-                                active_account['currentBalance'] = converted_balance
-
-        # _LOGGER.info('Accounts inforrmation after currency conversion:')
-        # for active_account in active_accounts:
-            # _LOGGER.info('  {} ({}): {} {}'.format(active_account['accountName'], active_account['id'], self._unit_of_measurement, active_account['currentBalance']))
-        active_accounts_sum = round(sum(active_account['currentBalance'] for active_account in active_accounts))
-        asset_accounts_sum = round(sum(asset_account['currentBalance'] for asset_account in asset_accounts))
-        liability_accounts_sum = round(sum(liability_account['currentBalance'] for liability_account in liability_accounts))
-
-        _LOGGER.info('Mint networth: {} {}, assets: {}, liabilities: {}'.format(self._unit_of_measurement, active_accounts_sum, asset_accounts_sum, liability_accounts_sum))
+        with self._mint_client.metrics.timer(STAGE_SENSOR_UPDATE):
+            self._update_from_snapshot()
+
+    def _update_from_snapshot(self):
+        snapshot = self._mint_client.snapshot
+        if snapshot is None:
+            return
+        totals = snapshot.totals
+        self._stale = snapshot.stale
+
+        _LOGGER.info('Mint networth: {} {}, assets: {}, liabilities: {}'.format(self._unit_of_measurement, totals.networth, totals.assets, totals.liabilities))
 
         # self._state = self._mint_client.get_net_worth()
-        self._state = active_accounts_sum
-        self._assets = asset_accounts_sum
-        self._liabilities = liability_accounts_sum
+        self._state = totals.networth
+        self._assets = totals.assets
+        self._liabilities = totals.liabilities
 
     @property
     def name(self):
@@ -225,18 +1072,18 @@ class MintNetWorthSensor(Entity):
             ATTR_ASSETS: self._assets,
             ATTR_LIABILITIES: self._liabilities
         }
-        # return attributes
-        return {}
+        attributes.update(self._mint_client.state_stats)
+        attributes[ATTR_STALE] = self._stale
+        return attributes
 
 
-class MintCategorySensor(Entity):
+class MintCategorySensor(MintEntity):
     """Representation of a personalcapital.com sensor."""
-    last_used = time.time() - MIN_TIME_BETWEEN_UPDATES
 
     def __init__(self, hass, mint_client, config, sensor_type):
         """Initialize the sensor."""
         self.hass = hass
-        self._mint_client = mint_client
+        super().__init__(mint_client)
         self._sensor_type = sensor_type
         self._productType = SENSOR_TYPES[sensor_type][0]
         self._name = 'Mint {}'.format(SENSOR_TYPES[sensor_type][1])
@@ -244,58 +1091,36 @@ class MintCategorySensor(Entity):
         self._state = None
         self._config = config
         self._unit_of_measurement = config[CONF_UNIT_OF_MEASUREMENT]
+        # Per-account sensors carry the rows; only list their ids here
+        self._ids_only = config.get(CONF_ACCOUNT_SENSORS, False)
+        self._attributes = None
+
+    def _wants(self, changed):
+        return self._sensor_type in changed
 
-    @Throttle(SCAN_INTERVAL)
-    def update(self):
+    async def async_update(self):
         """Get the latest state of the sensor."""
-        # self._mint_client.initiate_account_refresh()
         _LOGGER.info('Updating mint category - {}'.format(self._sensor_type))
+        with self._mint_client.metrics.timer(STAGE_SENSOR_UPDATE):
+            self._update_from_snapshot()
 
-        data = self._mint_client.get_accounts()
-
-        # Save new update time
-        # MintNetWorthSensor.last_used = time.time()
-
-        active_accounts = [account for account in data if account['isActive'] == True and account['isAccountNotFound'] == False and account['isClosed'] == False]
-        sensor_type_accounts = [account for account in active_accounts if account['accountType'] == self._sensor_type]
-
-        account_currency_overrides = self._config.get(CONF_ACCOUNT_CURRENCY_OVERRIDE)
-
-        if account_currency_overrides:
-            from currency_converter import CurrencyConverter
-            converter = CurrencyConverter()
-
-            for account_currency in account_currency_overrides:
-                for currency in account_currency.keys():
-                    override_accounts = account_currency[currency]
-                    # _LOGGER.info("{}-{}".format(currency, override_accounts))
-                    for override_account in override_accounts:
-                        for sensor_type_account in sensor_type_accounts:
-                            if sensor_type_account['id'] == override_account:
-                                converted_balance = round(converter.convert(sensor_type_account['currentBalance'], currency, self._unit_of_measurement))
-                                # _LOGGER.info('Account - {}: Converting {} {} to {} {}'.format(override_account, currency, sensor_type_account['currentBalance'], self._unit_of_measurement, converted_balance))
-                                sensor_type_account['currentBalance'] = converted_balance
-
-        sensor_type_accounts_sum = round(sum(sensor_type_account['currentBalance'] for sensor_type_account in sensor_type_accounts))
-        sensor_type_accounts_sum = format_balance(self._inverse_sign, sensor_type_accounts_sum)
-        _LOGGER.info('Mint Category - {}: {} {}'.format(self._sensor_type, self._unit_of_measurement, sensor_type_accounts_sum))
-        self._state = sensor_type_accounts_sum
-
-        self.hass.data[self._productType] = {'accounts': []}
-        for account in sensor_type_accounts:
-            _LOGGER.info('  ({}) {}: {} {}'.format(self._sensor_type, account['accountName'], self._unit_of_measurement, account['currentBalance']))
-            self.hass.data[self._productType].get('accounts').append({
-                "name": account.get('accountName', ''),
-                "id": account.get('id', ''),
-                "firm_name": account.get('fiName', ''),
-                # "logo": account.get('logoPath', ''),
-                "balance": format_balance(self._inverse_sign, account.get('currentBalance', 0.0)),
-                "account_type": account.get('accountType', ''),
-                # "url": account.get('homeUrl', ''),
-                "currency": account.get('currency', ''),
-                "refreshed": account.get('lastUpdatedInDate', ''),
-                # "refreshed": how_long_ago(account.get('lastUpdatedInDate', 0)) + ' ago',
-            })
+    def _update_from_snapshot(self):
+        snapshot = self._mint_client.snapshot
+        if snapshot is None:
+            return
+        totals = snapshot.totals
+
+        category = totals.categories[self._sensor_type]
+        _LOGGER.info('Mint Category - {}: {} {}'.format(self._sensor_type, self._unit_of_measurement, category.total))
+        self._state = category.total
+
+        if self._ids_only:
+            self._attributes = {ATTR_ACCOUNT_IDS: [account['id'] for account in category.accounts]}
+        else:
+            self._attributes = {ATTR_ACCOUNTS: list(category.accounts)}
+        self._attributes[ATTR_STALE] = snapshot.stale
+        for account in category.accounts:
+            _LOGGER.debug('  ({}) {}: {} {}'.format(self._sensor_type, account['name'], self._unit_of_measurement, account['balance']))
 
     @property
     def name(self):
@@ -320,12 +1145,305 @@ class MintCategorySensor(Entity):
     @property
     def device_state_attributes(self):
         """Return the state attributes of the sensor."""
-        return self.hass.data[self._productType]
+        return self._attributes
+
+
+class MintAccountSensor(MintEntity):
+    """Balance of one Mint account, read from the shared account store."""
+
+    def __init__(self, mint_client, config, account_id):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self.account_id = account_id
+        self._unit_of_measurement = config[CONF_UNIT_OF_MEASUREMENT]
+        row = mint_client.store.get(account_id)
+        self._name = 'Mint {} {}'.format(row['firm_name'], row['name'])
+        self._state = None
+        self._attributes = None
+
+    def _wants(self, changed):
+        return self.account_id in changed
 
-def how_long_ago(last_epoch):
-    a = last_epoch
-    b = datetime.now()
-    c = b - a
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        row = self._mint_client.store.get(self.account_id)
+        if row is None:
+            return
+        self._state = row['balance']
+        self._attributes = {
+            'id': row['id'],
+            'firm_name': row['firm_name'],
+            'account_type': row['account_type'],
+            'currency': row['currency'],
+            'refreshed': row['refreshed'],
+            ATTR_STALE: self._mint_client.store.stale,
+        }
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return self._unit_of_measurement
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:bank'
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        return self._attributes
+
+
+class MintBudgetSensor(MintEntity):
+    """Spending against one category's monthly Mint budget."""
+
+    def __init__(self, mint_client, config, category):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self._category = category
+        self._name = 'Mint Budget {}'.format(category)
+        self._unit_of_measurement = config[CONF_UNIT_OF_MEASUREMENT]
+        self._state = None
+        self._attributes = None
+
+    def _wants(self, changed):
+        return (ATTR_BUDGETS, self._category) in changed
+
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        budget = self._mint_client.budgets.get(self._category)
+        if budget is None:
+            return
+        self._state = budget.spent
+        self._attributes = {
+            'limit': budget.limit,
+            'remaining': budget.remaining,
+            'percent': budget.percent,
+        }
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return self._unit_of_measurement
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:wallet'
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        return self._attributes
+
+
+class MintSpendingSensor(MintEntity):
+    """Month-to-date spending in one Mint category."""
+
+    def __init__(self, mint_client, config, category):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self._category = category
+        self._name = 'Mint Spending {}'.format(category)
+        self._unit_of_measurement = config[CONF_UNIT_OF_MEASUREMENT]
+        self._state = None
+
+    def _wants(self, changed):
+        return ATTR_SPENDING in changed
+
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        self._state = self._mint_client.spending.get(self._category, 0.0)
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return self._unit_of_measurement
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:cart'
+
+
+class MintTrendSensor(MintEntity):
+    """One trend metric of the net worth or a category, computed from the balance history."""
+
+    def __init__(self, mint_client, config, series, metric):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self._series = series
+        self._metric = metric
+        series_name = 'Networth' if series == ATTR_NETWORTH else SENSOR_TYPES[series][1]
+        self._name = 'Mint {} {}'.format(series_name, METRICS[metric])
+        self._unit_of_measurement = '%' if metric == METRIC_MAX_DRAWDOWN else config[CONF_UNIT_OF_MEASUREMENT]
+        self._state = None
+
+    def _wants(self, changed):
+        return ATTR_TRENDS in changed
+
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        snapshot = self._mint_client.snapshot
+        if snapshot is None or snapshot.trends is None:
+            return
+        self._state = getattr(snapshot.trends[self._series], self._metric)
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return self._unit_of_measurement
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:chart-line'
+
+
+class MintStageTimeSensor(MintEntity):
+    """Last duration of one update pipeline stage, in milliseconds."""
+
+    def __init__(self, mint_client, stage):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self._stage = stage
+        self._name = 'Mint {} Time'.format(STAGES[stage])
+        self._state = None
+        self._attributes = None
+
+    def _wants(self, changed):
+        return ATTR_DIAGNOSTICS in changed
+
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        timing = self._mint_client.metrics.timing(self._stage)
+        if timing is None:
+            return
+        self._state = round(timing['last'] * 1000, 1)
+        self._attributes = {
+            'count': timing['count'],
+            'mean_ms': round(timing['mean'] * 1000, 1),
+            'max_ms': round(timing['max'] * 1000, 1),
+        }
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return 'ms'
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:timer'
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        return self._attributes
+
+
+class MintDiagnosticsSensor(MintEntity):
+    """Number of Mint fetches, with every pipeline counter and client stat as attributes."""
+
+    def __init__(self, mint_client):
+        """Initialize the sensor."""
+        super().__init__(mint_client)
+        self._state = None
+        self._attributes = None
+
+    def _wants(self, changed):
+        return ATTR_DIAGNOSTICS in changed
+
+    async def async_update(self):
+        """Get the latest state of the sensor."""
+        counters = self._mint_client.metrics.counters()
+        self._state = counters.get(COUNTER_FETCHES, 0)
+        attributes = self._mint_client.stats
+        attributes.update(counters)
+        self._attributes = attributes
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return 'Mint Diagnostics'
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement this sensor expresses itself in."""
+        return 'fetches'
+
+    @property
+    def icon(self):
+        """Return the icon to use in the frontend."""
+        return 'mdi:stethoscope'
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        return self._attributes
+
+
+def how_long_ago(last_updated):
+    """Return how long ago last_updated (a datetime or epoch seconds) was, e.g. '3 hours'."""
+    if not isinstance(last_updated, datetime):
+        last_updated = datetime.fromtimestamp(last_updated)
+    c = (datetime.now() - last_updated).total_seconds()
     days = c // 86400
     hours = c // 3600 % 24
     minutes = c // 60 % 60
@@ -336,6 +1454,3 @@ def how_long_ago(last_epoch):
         return str(round(hours)) + ' hours'
     return str(round(minutes)) + ' minutes'
 
-
-def format_balance(inverse_sign, balance):
-    return -1.0 * balance if inverse_sign is True else balance
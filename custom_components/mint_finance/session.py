@@ -0,0 +1,128 @@
+"""
+Warm Mint browser session.
+
+Keeps one logged in mintapi.Mint (and its Chrome driver) alive between
+fetches, refreshing the API token in place when the session goes stale and
+only paying for a full browser login when the driver itself is gone.
+"""
+
+import logging
+import time
+
+from .lazy import mintapi
+from .metrics import COUNTER_LOGINS, COUNTER_TOKEN_REFRESHES, NULL_METRICS, STAGE_LOGIN
+
+_LOGGER = logging.getLogger(__name__)
+
+MINT_OVERVIEW_URL = 'https://mint.intuit.com/overview.event'
+
+ATTR_SESSION_REUSES = 'session_reuses'
+ATTR_SESSION_REFRESHES = 'session_token_refreshes'
+ATTR_SESSION_COLD_LOGINS = 'session_cold_logins'
+
+
+class MintSession(object):
+    """Own a single mintapi.Mint instance and hand it out warm."""
+
+    def __init__(self, username, password, session_path, headless=False, metrics=NULL_METRICS):
+        self._username = username
+        self._password = password
+        self._session_path = session_path
+        self._headless = headless
+        self._metrics = metrics
+        self._mint = None
+        self._suspect = False
+        self.created_at = None
+        self.reuse_count = 0
+        self.refresh_count = 0
+        self.cold_login_count = 0
+
+    @property
+    def session_path(self):
+        return self._session_path
+
+    @property
+    def driver_pid(self):
+        """Return the chromedriver process id, or None while there is no browser."""
+        try:
+            return self._mint.driver.service.process.pid
+        except AttributeError:
+            return None
+
+    @property
+    def stats(self):
+        """Return reuse versus login counters."""
+        return {
+            ATTR_SESSION_REUSES: self.reuse_count,
+            ATTR_SESSION_REFRESHES: self.refresh_count,
+            ATTR_SESSION_COLD_LOGINS: self.cold_login_count,
+        }
+
+    def acquire(self):
+        """Return a logged in Mint client, creating the browser only if needed."""
+        if self._mint is not None and not self._suspect and self._is_alive():
+            self.reuse_count += 1
+            return self._mint
+
+        if self._mint is not None and self._refresh_in_place():
+            self.refresh_count += 1
+            self._metrics.increment(COUNTER_TOKEN_REFRESHES)
+            return self._mint
+
+        with self._metrics.timer(STAGE_LOGIN):
+            self._login()
+        self._metrics.increment(COUNTER_LOGINS)
+        return self._mint
+
+    def invalidate(self):
+        """Mark the session as suspect after a failed call.
+
+        The next acquire() tries to refresh the token on the existing driver
+        before falling back to a cold login.
+        """
+        self._suspect = True
+
+    def close(self):
+        if self._mint is not None:
+            try:
+                self._mint.close()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.debug('Error closing mint session', exc_info=True)
+        self._mint = None
+        self._suspect = False
+        self.created_at = None
+
+    def _is_alive(self):
+        """Cheap health probe: one chromedriver round-trip, no page load."""
+        driver = getattr(self._mint, 'driver', None)
+        if driver is None:
+            return False
+        try:
+            driver.current_url
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    def _refresh_in_place(self):
+        """Reload the overview page on the live driver and grab a new token."""
+        if not self._is_alive():
+            return False
+        try:
+            self._mint.driver.get(MINT_OVERVIEW_URL)
+            self._mint.token = self._mint.get_token()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.info('Could not refresh mint token in place, logging in again')
+            return False
+        self._suspect = False
+        return True
+
+    def _login(self):
+        self.close()
+        _LOGGER.info('Logging into mint with a new browser session')
+        self._mint = mintapi.Mint(self._username,
+            self._password,
+            session_path=self._session_path,
+            # wait_for_sync=False,
+            headless=self._headless)
+        self.cold_login_count += 1
+        self.created_at = time.time()
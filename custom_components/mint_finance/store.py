@@ -0,0 +1,91 @@
+"""
+Latest account rows, keyed by Mint account id, and budgets, keyed by category.
+
+MintClient applies each new snapshot's changed categories to the account
+store, and the per-account sensors read their one row from it. update()
+reports which rows actually changed, so one balance moving wakes up one
+entity, and whether accounts appeared or went away, so entities can be
+added and removed. BudgetStore does the same for budget fetches.
+"""
+
+
+class AccountStore(object):
+    """Account rows by id, plus the ids in each category."""
+
+    def __init__(self):
+        self.accounts = {}
+        self.stale = None
+        self._category_ids = {}
+
+    def __contains__(self, account_id):
+        return account_id in self.accounts
+
+    def get(self, account_id):
+        return self.accounts.get(account_id)
+
+    def category_ids(self, account_type):
+        return self._category_ids.get(account_type, frozenset())
+
+    def update(self, categories, stale, changed_types=None):
+        """Apply {account type: CategoryTotals} and return (changed ids, membership changed).
+
+        Only the categories in changed_types are looked at (all of them when
+        it is None), plus any category that is no longer in categories,
+        whose rows are all gone. Changed ids covers rows that are new,
+        different or gone; every row counts as changed when `stale` flips.
+        """
+        if changed_types is None:
+            changed_types = categories.keys()
+        changed = set()
+        removed = set()
+        added = set()
+        gone_types = set(self._category_ids).difference(categories)
+        for account_type in gone_types.union(changed_types):
+            if account_type in categories:
+                rows = dict((row['id'], row) for row in categories[account_type].accounts)
+            else:
+                rows = {}
+            removed.update(self._category_ids.get(account_type, frozenset()).difference(rows))
+            for account_id, row in rows.items():
+                if self.accounts.get(account_id) != row:
+                    changed.add(account_id)
+                    if account_id not in self.accounts:
+                        added.add(account_id)
+                    self.accounts[account_id] = row
+            if rows:
+                self._category_ids[account_type] = frozenset(rows)
+            else:
+                self._category_ids.pop(account_type, None)
+
+        # An account that moved category shows up in both; it is not gone
+        present = set().union(*self._category_ids.values()) if self._category_ids else set()
+        removed.difference_update(present)
+        for account_id in removed:
+            del self.accounts[account_id]
+        changed.update(removed)
+
+        if stale != self.stale:
+            self.stale = stale
+            changed.update(self.accounts)
+        return changed, bool(added or removed)
+
+
+class BudgetStore(object):
+    """MintBudget records by category."""
+
+    def __init__(self):
+        self.budgets = {}
+
+    def __contains__(self, category):
+        return category in self.budgets
+
+    def get(self, category):
+        return self.budgets.get(category)
+
+    def update(self, budgets):
+        """Replace the budgets with {category: MintBudget}; return (changed categories, membership changed)."""
+        changed = set(category for category, budget in budgets.items() if self.budgets.get(category) != budget)
+        removed = set(self.budgets).difference(budgets)
+        added = changed.difference(self.budgets)
+        self.budgets = budgets
+        return changed | removed, bool(added or removed)
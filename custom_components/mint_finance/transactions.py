@@ -0,0 +1,284 @@
+"""
+Incremental transaction sync.
+
+Mint returns cash transactions newest first, a page at a time. The first
+sync of a login backfills page by page, committing each page and its offset
+so an interrupted backfill picks up where it stopped. After that, every sync
+reads pages only until they reach LOOKBACK_DAYS before the watermark, the
+newest transaction date seen so far. The lookback picks up pending
+transactions that post late or change, and stored transactions dated in it
+that the pages no longer list are deleted: Mint drops a pending transaction
+once it posts under a new id.
+
+Transactions live in a SQLite table indexed by id and date. Month-to-date
+spending is kept in a separate (month, category) table that each upsert
+adjusts by the difference between a transaction's old and new
+contribution, so reading it never scans the transactions.
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+_LOGGER = logging.getLogger(__name__)
+
+TRANSACTIONS_PATH = '.mint-transactions.db'
+LOOKBACK_DAYS = 7
+COLUMNS = ('id', 'login', 'date', 'amount', 'category', 'merchant', 'account', 'pending', 'spending')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    login INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    merchant TEXT NOT NULL,
+    account TEXT NOT NULL,
+    pending INTEGER NOT NULL,
+    spending REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_category_date ON transactions (category, date);
+CREATE TABLE IF NOT EXISTS spending (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (month, category)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def parse_mint_date(value, today):
+    """Parse getJsonData's 'Oct 15' (this year) or '10/15/18' dates."""
+    if '/' in value:
+        return datetime.strptime(value, '%m/%d/%y').date()
+    parsed = datetime.strptime('{} {}'.format(value, today.year), '%b %d %Y').date()
+    # Around new year the short form can still mean last December
+    if parsed > today + timedelta(days=1):
+        parsed = parsed.replace(year=today.year - 1)
+    return parsed
+
+
+def parse_amount(value):
+    """Parse '$1,234.56' (or a plain number) into a float."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(value.replace('$', '').replace(',', '').strip() or 0)
+
+
+def normalize_transaction(transaction, login, today):
+    """Return a transactions table row for a getJsonData transaction dict.
+
+    amount is signed, negative for debits. spending is what the
+    transaction adds to its category's spending: the debit, or minus a
+    refund, for spending transactions that are not transfers or duplicates.
+    """
+    amount = parse_amount(transaction.get('amount', 0))
+    if transaction.get('isDebit'):
+        amount = -amount
+    spending = 0.0
+    if (transaction.get('isSpending', transaction.get('isDebit'))
+            and not transaction.get('isTransfer') and not transaction.get('isDuplicate')):
+        spending = -amount
+    return (
+        int(transaction['id']),
+        login,
+        parse_mint_date(transaction['date'], today).isoformat(),
+        amount,
+        transaction.get('category') or 'Uncategorized',
+        transaction.get('merchant') or '',
+        transaction.get('account') or '',
+        1 if transaction.get('isPending') else 0,
+        spending,
+    )
+
+
+class TransactionStore(object):
+    """SQLite transactions with incrementally maintained monthly spending."""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            # Opened on the worker thread, but closed from whichever thread shuts down
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def delete_meta(self, key):
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM meta WHERE key = ?', (key,))
+
+    def upsert(self, rows, meta=None):
+        """Insert or replace rows and adjust monthly spending; return how many rows were new or changed.
+
+        meta ({key: value}) is written in the same commit.
+        """
+        if not rows:
+            return 0
+        with self._lock, self._connect() as db:
+            old = {}
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                old.update((row[0], row) for row in db.execute(
+                    'SELECT {} FROM transactions WHERE id IN ({})'.format(
+                        ', '.join(COLUMNS), ','.join('?' * len(chunk))), chunk))
+
+            deltas = {}
+            changed = []
+            for row in rows:
+                previous = old.get(row[0])
+                if previous == row:
+                    continue
+                changed.append(row)
+                if previous is not None and previous[8]:
+                    key = (previous[2][:7], previous[4])
+                    deltas[key] = deltas.get(key, 0.0) - previous[8]
+                if row[8]:
+                    key = (row[2][:7], row[4])
+                    deltas[key] = deltas.get(key, 0.0) + row[8]
+
+            db.executemany(
+                'INSERT OR REPLACE INTO transactions ({}) VALUES ({})'.format(
+                    ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), changed)
+            self._apply(db, deltas, meta)
+            return len(changed)
+
+    def prune(self, login, start, end, keep_ids, meta=None):
+        """Delete login's transactions with start <= date <= end (ISO dates) not in keep_ids; return how many.
+
+        Their spending comes off the monthly totals, and meta is written, in the same commit.
+        """
+        with self._lock, self._connect() as db:
+            removed = [row for row in db.execute(
+                'SELECT {} FROM transactions WHERE login = ? AND date >= ? AND date <= ?'.format(
+                    ', '.join(COLUMNS)), (login, start, end)) if row[0] not in keep_ids]
+            deltas = {}
+            for row in removed:
+                if row[8]:
+                    key = (row[2][:7], row[4])
+                    deltas[key] = deltas.get(key, 0.0) - row[8]
+            db.executemany('DELETE FROM transactions WHERE id = ?', [(row[0],) for row in removed])
+            self._apply(db, deltas, meta)
+            return len(removed)
+
+    @staticmethod
+    def _apply(db, deltas, meta):
+        """Add deltas ({(month, category): amount}) to the monthly spending and write meta."""
+        for (month, category), delta in deltas.items():
+            db.execute('INSERT OR IGNORE INTO spending (month, category, total) VALUES (?, ?, 0)',
+                       (month, category))
+            db.execute('UPDATE spending SET total = total + ? WHERE month = ? AND category = ?',
+                       (delta, month, category))
+        for key, value in (meta or {}).items():
+            db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def month_spending(self, month):
+        """Return {category: spending} for a 'YYYY-MM' month."""
+        with self._lock:
+            return dict(
+                (category, round(total, 2)) for category, total in self._connect().execute(
+                    'SELECT category, total FROM spending WHERE month = ?', (month,)))
+
+    def query(self, start=None, end=None, category=None, limit=None):
+        """Return up to limit COLUMNS rows with start <= date <= end (ISO dates), newest first."""
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append('date >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('date <= ?')
+            params.append(end)
+        if category is not None:
+            clauses.append('category = ?')
+            params.append(category)
+        sql = 'SELECT {} FROM transactions'.format(', '.join(COLUMNS))
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY date DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+
+class TransactionSync(object):
+    """Backfill, then incrementally sync, each login's transactions into a TransactionStore."""
+
+    def __init__(self, store, backfill_days=None, lookback_days=LOOKBACK_DAYS):
+        self.store = store
+        self.backfill_days = backfill_days
+        self.lookback_days = lookback_days
+        self.page_count = 0
+
+    def sync(self, login, backend, today=None):
+        """Sync one login through its backend; return the number of new, changed or removed transactions."""
+        today = today or date.today()
+        watermark_key = 'watermark_date:{}'.format(login)
+        offset_key = 'backfill_offset:{}'.format(login)
+
+        watermark = self.store.get_meta(watermark_key)
+        if watermark is None:
+            offset = int(self.store.get_meta(offset_key, 0))
+            cutoff = today - timedelta(days=self.backfill_days) if self.backfill_days else None
+            _LOGGER.info('Backfilling mint transactions for login %s from offset %s', login + 1, offset)
+        else:
+            offset = 0
+            cutoff = datetime.strptime(watermark, '%Y-%m-%d').date() - timedelta(days=self.lookback_days)
+
+        newest = watermark
+        seen = set()
+        changed = 0
+        while True:
+            page = backend.get_transactions(offset)
+            self.page_count += 1
+            if not page:
+                break
+            rows = [normalize_transaction(transaction, login, today) for transaction in page]
+            if cutoff is not None:
+                rows = [row for row in rows if row[2] >= cutoff.isoformat()]
+            offset += len(page)
+            if rows:
+                newest = max(newest or rows[0][2], max(row[2] for row in rows))
+            seen.update(row[0] for row in rows)
+            # Record backfill progress with the page, so a restart resumes here
+            changed += self.store.upsert(rows, {offset_key: offset} if watermark is None else None)
+            if cutoff is not None and len(rows) < len(page):
+                break
+
+        if watermark is not None:
+            # The pages listed every transaction from the cutoff on
+            changed += self.store.prune(login, cutoff.isoformat(), newest, seen, {watermark_key: newest})
+        elif newest is not None:
+            self.store.set_meta(watermark_key, newest)
+        self.store.delete_meta(offset_key)
+        _LOGGER.debug('Synced %s changed mint transactions for login %s, watermark %s',
+                      changed, login + 1, newest)
+        return changed
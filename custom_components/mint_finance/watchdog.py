@@ -0,0 +1,164 @@
+"""
+Browser process watchdog.
+
+A mintapi Chrome session kept warm for days keeps growing, and a crash or
+a hard restart can leave chromedriver and Chrome processes behind.
+BrowserWatchdog measures each session's driver process tree (chromedriver
+and every Chrome process under it) and the session's age, and closes a
+session that crossed either limit, killing whatever close() left running.
+The next fetch then logs in with a fresh browser. MintClient only runs it
+on its worker between fetch cycles, so a fetch never loses its browser
+halfway through.
+
+reap_orphans() runs once at startup, before any login. It kills Chrome
+processes left over from an earlier run that use one of our session
+directories, together with the chromedriver that started them.
+"""
+
+import logging
+import os
+import time
+
+from .lazy import psutil
+from .metrics import COUNTER_BROWSER_RECYCLES, COUNTER_ORPHANS_REAPED, NULL_METRICS
+
+_LOGGER = logging.getLogger(__name__)
+
+BROWSER_MAX_MEMORY = 1024
+BROWSER_MAX_AGE = 24 * 60 * 60
+# Seconds a process gets to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 5
+USER_DATA_DIR_ARG = 'user-data-dir='
+
+ATTR_BROWSER_RECYCLES = 'browser_recycles'
+ATTR_ORPHANS_REAPED = 'orphans_reaped'
+
+
+def process_tree(pid):
+    """Return the psutil Process for pid followed by all its descendants; empty when it is gone."""
+    try:
+        process = psutil.Process(pid)
+        return [process] + process.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def tree_memory(processes):
+    """Return the summed resident memory of processes, in bytes."""
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+def terminate(processes, timeout=TERMINATE_TIMEOUT):
+    """Terminate processes, kill the ones still running after timeout and reap them all.
+
+    Returns how many were still running.
+    """
+    running = []
+    for process in processes:
+        try:
+            process.terminate()
+            running.append(process)
+        except psutil.Error:
+            pass
+    gone, alive = psutil.wait_procs(running, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(alive, timeout=timeout)
+    return len(gone) + len(alive)
+
+
+def user_data_dir(cmdline):
+    """Return the absolute Chrome user data directory in a command line, or None."""
+    for arg in cmdline or []:
+        arg = arg.lstrip('-')
+        if arg.startswith(USER_DATA_DIR_ARG):
+            return os.path.abspath(arg[len(USER_DATA_DIR_ARG):])
+    return None
+
+
+class BrowserWatchdog(object):
+    """Recycle browser sessions that use too much memory or have run too long."""
+
+    def __init__(self, max_memory=BROWSER_MAX_MEMORY, max_age=BROWSER_MAX_AGE, metrics=NULL_METRICS):
+        """max_memory is in MB and max_age in seconds; 0 or None turns that limit off."""
+        self.max_rss = max_memory * 1024 * 1024 if max_memory else None
+        self.max_age = max_age or None
+        self.metrics = metrics
+        self.recycle_count = 0
+        self.reaped_count = 0
+
+    @property
+    def stats(self):
+        # Memory is left out: it moves every cycle and would make every cycle a state change
+        return {
+            ATTR_BROWSER_RECYCLES: self.recycle_count,
+            ATTR_ORPHANS_REAPED: self.reaped_count,
+        }
+
+    def check(self, session, now=None):
+        """Return why session's browser should be recycled, or None while it is within limits."""
+        pid = session.driver_pid
+        if pid is None:
+            return None
+        now = now or time.time()
+        if self.max_age and session.created_at and now - session.created_at > self.max_age:
+            return 'running for {:.1f} hours'.format((now - session.created_at) / 3600)
+        rss = tree_memory(process_tree(pid))
+        _LOGGER.debug('Mint browser %s uses %.0f MB', pid, rss / (1024 * 1024))
+        if self.max_rss and rss > self.max_rss:
+            return 'using {:.0f} MB'.format(rss / (1024 * 1024))
+        return None
+
+    def recycle(self, session, reason):
+        """Close session's browser and kill any of its processes that outlive close()."""
+        processes = process_tree(session.driver_pid)
+        _LOGGER.info('Recycling mint browser session, %s', reason)
+        session.close()
+        survivors = [process for process in processes if process.is_running()]
+        if survivors:
+            _LOGGER.warning('Killing %s mint browser processes left after closing the session', len(survivors))
+            terminate(survivors)
+        self.recycle_count += 1
+        self.metrics.increment(COUNTER_BROWSER_RECYCLES)
+
+    def watch(self, sessions):
+        """Check every session and recycle the ones over a limit."""
+        for session in sessions:
+            reason = self.check(session)
+            if reason is not None:
+                self.recycle(session, reason)
+
+    def reap_orphans(self, session_paths):
+        """Kill browsers left running on our session directories; return how many processes were reaped.
+
+        Only call this while none of the sessions has a browser of its own.
+        """
+        session_dirs = frozenset(os.path.abspath(path) for path in session_paths)
+        orphans = {}
+        for process in psutil.process_iter(attrs=['pid', 'name', 'cmdline']):
+            if user_data_dir(process.info['cmdline']) not in session_dirs:
+                continue
+            try:
+                tree = [process] + process.children(recursive=True)
+                parent = process.parent()
+                if parent is not None and 'chromedriver' in parent.name():
+                    tree.append(parent)
+            except psutil.Error:
+                continue
+            orphans.update((orphan.pid, orphan) for orphan in tree)
+        if not orphans:
+            return 0
+        reaped = terminate(list(orphans.values()))
+        _LOGGER.warning('Reaped %s orphaned mint browser processes', reaped)
+        self.reaped_count += reaped
+        self.metrics.increment(COUNTER_ORPHANS_REAPED, reaped)
+        return reaped
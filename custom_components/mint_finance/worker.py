@@ -0,0 +1,451 @@
+"""
+Out-of-process Mint fetch worker.
+
+With the worker option on, mintapi, Selenium and Chrome run in a separate,
+long-lived Python process instead of inside Home Assistant, so a hung page
+load or a leaking browser cannot take Home Assistant down with it. Each
+login's RemoteBackend connects to the worker over a unix socket and sends
+it the login's backend spec. The worker builds that backend with
+build_backend and runs every call on it, one call at a time per login.
+
+Messages are JSON objects, each preceded by its length as a 4 byte big
+endian integer. A request is {id, method, params}. The reply is {id,
+result, stats} or {id, error: {type, message}}. Accounts come back
+normalized, as account_to_row lists, which keeps the payload small and
+JSON safe.
+
+Failure handling:
+
+* Timeouts: a call that gets no reply within the timeout kills the worker.
+  It is started again by the next call.
+* Restarts: a worker that died or cannot be reached is respawned
+  automatically.
+* Backpressure: a RemoteBackend with a call in flight and another one
+  waiting for it refuses further calls instead of queueing them behind a
+  worker that may be hung.
+
+Every one of these surfaces as a BackendError, so MintClient's retries and
+circuit breaker apply as usual.
+
+The worker runs in its own session, so it outlives Home Assistant. With
+persist on, closing a RemoteBackend only disconnects. After a restart, Home
+Assistant reconnects to the same worker and finds its browsers still logged
+in. The worker exits once no one has connected for its idle timeout. It
+reaps orphaned browsers before a login's first call, and recycles that
+login's browser after an account fetch when it is over the watchdog limits.
+
+Run it by hand from the Home Assistant config directory with
+python -m custom_components.mint_finance.worker --socket .mint-worker.sock
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from .backend import BackendError, MintBackend, build_backend
+from .models import account_from_row, account_to_row, normalize_account
+from .watchdog import BROWSER_MAX_AGE, BROWSER_MAX_MEMORY, BrowserWatchdog
+
+_LOGGER = logging.getLogger(__name__)
+
+WORKER_PATH = '.mint-worker.sock'
+# Bumped whenever the messages change; a worker speaking another version is replaced
+PROTOCOL_VERSION = 1
+WORKER_TIMEOUT = 300
+WORKER_START_TIMEOUT = 30
+# How long a worker with no connections stays up, waiting for Home Assistant to come back
+WORKER_IDLE_TIMEOUT = 60 * 60
+WORKER_IDLE_TIMEOUT_NO_PERSIST = 60
+# Calls a RemoteBackend accepts at once: one in flight and one waiting
+MAX_PENDING = 2
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+ERROR_BACKEND = 'backend'
+ERROR_INTERNAL = 'internal'
+
+ATTR_WORKER_STARTS = 'worker_starts'
+ATTR_WORKER_TIMEOUTS = 'worker_timeouts'
+ATTR_WORKER_BUSY = 'worker_busy'
+
+_HEADER = struct.Struct('>I')
+
+
+def send_message(sock, message):
+    data = json.dumps(message, separators=(',', ':')).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(sock):
+    """Return the next message on sock, or None once the other end closed it."""
+    header = _receive_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    size, = _HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError('Message of {} bytes is too large'.format(size))
+    data = _receive_exactly(sock, size)
+    if data is None:
+        raise ConnectionError('Connection closed mid message')
+    return json.loads(data.decode())
+
+
+def login_key(spec):
+    """Return what identifies a login in the worker, along with a digest of its whole spec."""
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return (spec.get('backend'), spec.get('username'), spec.get('session_path'), spec.get('seed')), digest
+
+
+class _WorkerLogin(object):
+    """One login's backend in the worker, with its call lock and watchdog."""
+
+    def __init__(self, spec, digest=None):
+        self.digest = digest
+        self.backend = build_backend(spec)
+        self.watchdog = None
+        session = getattr(self.backend, 'session', None)
+        if session is not None:
+            self.watchdog = BrowserWatchdog(
+                spec.get('browser_max_memory', BROWSER_MAX_MEMORY), spec.get('browser_max_age', BROWSER_MAX_AGE))
+            try:
+                # Browsers of a worker that was killed are still running on this directory
+                self.watchdog.reap_orphans([spec['session_path']])
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.warning('Could not look for orphaned mint browser processes', exc_info=True)
+        self._lock = threading.Lock()
+
+    def get_accounts(self):
+        return [account_to_row(normalize_account(account)) for account in self.backend.get_accounts()]
+
+    def call(self, method, params):
+        if method not in ('get_accounts', 'initiate_account_refresh', 'get_transactions', 'get_budgets',
+                          'invalidate', 'close'):
+            return {'error': {'type': ERROR_INTERNAL, 'message': 'Unknown method {}'.format(method)}}
+        with self._lock:
+            target = self if method == 'get_accounts' else self.backend
+            try:
+                result = getattr(target, method)(**params)
+            except BackendError as exp:
+                return {'error': {'type': ERROR_BACKEND, 'message': str(exp)}}
+            except Exception as exp:  # pylint: disable=broad-except
+                _LOGGER.exception('Error running %s', method)
+                return {'error': {'type': ERROR_INTERNAL, 'message': '{}: {}'.format(type(exp).__name__, exp)}}
+            if method == 'get_accounts' and self.watchdog is not None:
+                # Between two fetch cycles, as the calls of one login never overlap
+                self.watchdog.watch([self.backend.session])
+            return {'result': result, 'stats': self.stats}
+
+    @property
+    def stats(self):
+        stats = dict(self.backend.stats)
+        if self.watchdog is not None:
+            stats.update(self.watchdog.stats)
+        return stats
+
+    def close(self):
+        with self._lock:
+            self.backend.close()
+
+
+class WorkerServer(object):
+    """Serve the logins' backends over a unix socket until idle for idle_timeout seconds."""
+
+    def __init__(self, socket_path, idle_timeout=WORKER_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self._logins = {}
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._idle_since = time.time()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The logins' passwords go over this socket: owner only
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        server.listen(8)
+        server.settimeout(1.0)
+        _LOGGER.info('Mint worker %s listening on %s', os.getpid(), self.socket_path)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    with self._lock:
+                        idle = not self._connections and time.time() - self._idle_since > self.idle_timeout
+                    if idle:
+                        _LOGGER.info('Mint worker idle for %ss, exiting', self.idle_timeout)
+                        break
+                    continue
+                with self._lock:
+                    self._connections += 1
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            for login in list(self._logins.values()):
+                try:
+                    login.close()
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.warning('Error closing a mint backend', exc_info=True)
+
+    def _login(self, spec):
+        key, digest = login_key(spec)
+        with self._lock:
+            previous = self._logins.get(key)
+            if previous is not None and previous.digest == digest:
+                return previous
+            self._logins.pop(key, None)
+        if previous is not None:
+            # A changed password, timeout or limit: the old backend was built from a stale spec.
+            # Closed first, so its browser is gone before the new login reaps the session directory.
+            _LOGGER.info('Replacing the mint backend of a login whose settings changed')
+            try:
+                previous.close()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.warning('Error closing a mint backend', exc_info=True)
+        with self._lock:
+            login = self._logins.get(key)
+            if login is None or login.digest != digest:
+                login = self._logins[key] = _WorkerLogin(spec, digest)
+            return login
+
+    def _serve_connection(self, connection):
+        login = None
+        try:
+            while True:
+                request = receive_message(connection)
+                if request is None:
+                    break
+                method = request.get('method')
+                if method == 'hello':
+                    try:
+                        login = self._login(request['params']['spec'])
+                        response = {'result': {'version': PROTOCOL_VERSION, 'pid': os.getpid()}, 'stats': login.stats}
+                    except Exception as exp:  # pylint: disable=broad-except
+                        _LOGGER.exception('Error setting up a mint backend')
+                        response = {'error': {'type': ERROR_INTERNAL, 'message': str(exp)}}
+                elif method == 'shutdown':
+                    self.stop()
+                    response = {'result': None}
+                elif login is None:
+                    response = {'error': {'type': ERROR_INTERNAL, 'message': 'hello must come first'}}
+                else:
+                    response = login.call(method, request.get('params') or {})
+                response['id'] = request.get('id')
+                send_message(connection, response)
+        except (OSError, ValueError) as exp:
+            _LOGGER.info('Mint worker connection closed: %s', exp)
+        finally:
+            connection.close()
+            with self._lock:
+                self._connections -= 1
+                self._idle_since = time.time()
+
+
+_spawn_lock = threading.Lock()
+_worker_process = None
+
+
+def _connect(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def spawn_worker(socket_path, idle_timeout=WORKER_IDLE_TIMEOUT):
+    """Start a detached worker on socket_path; it logs next to the socket."""
+    global _worker_process
+    if _worker_process is not None:
+        # Reap the previous one, if it exited
+        _worker_process.poll()
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(socket_path + '.log', 'a') as log:
+        _worker_process = subprocess.Popen(
+            [sys.executable, '-m', __name__, '--socket', os.path.abspath(socket_path),
+             '--idle-timeout', str(idle_timeout)],
+            cwd=package_root, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+            # Its own session, so it survives a Home Assistant restart
+            start_new_session=True)
+    return _worker_process
+
+
+class RemoteBackend(MintBackend):
+    """Run a login's backend in the worker process, starting the worker when needed."""
+
+    def __init__(self, spec, socket_path, timeout=WORKER_TIMEOUT, persist=False):
+        self.spec = spec
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.persist = persist
+        self._sock = None
+        self._request_id = 0
+        self._worker_pid = None
+        self._remote_stats = {}
+        self._lock = threading.Lock()
+        self._pending = threading.BoundedSemaphore(MAX_PENDING)
+        self.start_count = 0
+        self.timeout_count = 0
+        self.busy_count = 0
+
+    def _connect(self):
+        with _spawn_lock:
+            sock = _connect(self.socket_path)
+            if sock is None:
+                _LOGGER.info('Starting the mint worker on %s', self.socket_path)
+                process = spawn_worker(
+                    self.socket_path, WORKER_IDLE_TIMEOUT if self.persist else WORKER_IDLE_TIMEOUT_NO_PERSIST)
+                self.start_count += 1
+                deadline = time.time() + WORKER_START_TIMEOUT
+                while sock is None:
+                    if process.poll() is not None or time.time() > deadline:
+                        raise BackendError('Mint worker did not start, see {}.log'.format(self.socket_path))
+                    time.sleep(0.1)
+                    sock = _connect(self.socket_path)
+        sock.settimeout(self.timeout)
+        self._sock = sock
+        hello = self._exchange('hello', {'spec': self.spec})
+        if 'error' in hello:
+            self._disconnect()
+            raise BackendError(hello['error']['message'])
+        if hello['result'].get('version') != PROTOCOL_VERSION:
+            _LOGGER.warning('Replacing a mint worker running another protocol version')
+            self._exchange('shutdown', {})
+            self._disconnect()
+            raise BackendError('Mint worker was outdated')
+        self._worker_pid = hello['result']['pid']
+        self._remote_stats = hello.get('stats', {})
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _kill_worker(self):
+        self._disconnect()
+        if self._worker_pid is not None:
+            try:
+                os.kill(self._worker_pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self._worker_pid = None
+
+    def _exchange(self, method, params):
+        self._request_id += 1
+        send_message(self._sock, {'id': self._request_id, 'method': method, 'params': params})
+        response = receive_message(self._sock)
+        if response is None:
+            raise ConnectionError('Mint worker closed the connection')
+        return response
+
+    def _call(self, method, **params):
+        if not self._pending.acquire(blocking=False):
+            self.busy_count += 1
+            raise BackendError('Mint worker is still busy with earlier calls')
+        try:
+            with self._lock:
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    response = self._exchange(method, params)
+                except socket.timeout:
+                    self.timeout_count += 1
+                    _LOGGER.error('Mint worker did not answer %s within %ss, restarting it', method, self.timeout)
+                    self._kill_worker()
+                    raise BackendError('Mint worker timed out')
+                except (OSError, ValueError) as exp:
+                    self._disconnect()
+                    raise BackendError('Lost the mint worker: {}'.format(exp)) from exp
+        finally:
+            self._pending.release()
+        if 'stats' in response:
+            self._remote_stats = response['stats']
+        error = response.get('error')
+        if error:
+            raise BackendError(error['message'])
+        return response.get('result')
+
+    def get_accounts(self):
+        return [account_from_row(row)._asdict() for row in self._call('get_accounts')]
+
+    def initiate_account_refresh(self):
+        self._call('initiate_account_refresh')
+
+    def get_transactions(self, offset=0):
+        return self._call('get_transactions', offset=offset)
+
+    def get_budgets(self):
+        return self._call('get_budgets')
+
+    def invalidate(self):
+        try:
+            self._call('invalidate')
+        except BackendError as exp:
+            _LOGGER.debug('Could not invalidate the mint worker session: %s', exp)
+
+    def close(self):
+        # With persist on the browser stays logged in, for the next Home Assistant run
+        if not self.persist and self._sock is not None:
+            try:
+                self._call('close')
+            except BackendError as exp:
+                _LOGGER.debug('Could not close the mint worker session: %s', exp)
+        with self._lock:
+            self._disconnect()
+
+    @property
+    def stats(self):
+        stats = dict(self._remote_stats)
+        stats[ATTR_WORKER_STARTS] = self.start_count
+        stats[ATTR_WORKER_TIMEOUTS] = self.timeout_count
+        stats[ATTR_WORKER_BUSY] = self.busy_count
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Mint backends over a unix socket.')
+    parser.add_argument('--socket', default=WORKER_PATH)
+    parser.add_argument('--idle-timeout', type=float, default=WORKER_IDLE_TIMEOUT,
+                        help='exit after this many seconds without connections')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    server = WorkerServer(args.socket, args.idle_timeout)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""Make custom_components importable when pytest runs from the repository root."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
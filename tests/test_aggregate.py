@@ -0,0 +1,89 @@
+"""aggregate_accounts totals over MintAccount records."""
+
+from custom_components.mint_finance.aggregate import aggregate_accounts
+from custom_components.mint_finance.models import MintAccount
+
+
+def account(account_id, account_type, balance, currency='USD', closed=False):
+    return MintAccount(account_id, 'Account {}'.format(account_id), 'Test Bank', account_type, balance,
+                       currency, None, True, False, closed)
+
+
+ACCOUNTS = (
+    account(1, 'bank', 1000.0),
+    account(2, 'investment', 5000.4),
+    account(3, 'credit', 250.0),
+    account(4, 'mortgage', 100000.0),
+    account(5, 'unclassified', 42.0),
+    account(6, 'bank', 300.0, closed=True),
+)
+
+
+def test_liabilities_are_negative_and_add_up():
+    totals = aggregate_accounts(ACCOUNTS, 'USD')
+    assert totals.categories['credit'].balance == -250.0
+    assert totals.categories['mortgage'].total == -100000
+    assert totals.assets == 6000
+    assert totals.liabilities == -100250
+    # Types outside SENSOR_TYPES still count towards net worth
+    assert totals.networth == round(1000.0 + 5000.4 - 250.0 - 100000.0 + 42.0)
+
+
+def test_closed_accounts_and_empty_categories():
+    totals = aggregate_accounts(ACCOUNTS, 'USD')
+    assert [row['id'] for row in totals.categories['bank'].accounts] == [1]
+    assert totals.categories['vehicle'].total == 0
+    assert totals.categories['vehicle'].accounts == ()
+    assert totals.categories['investment'].accounts[0]['account_type'] == 'investment'
+
+
+class FakeConverter(object):
+    """Converts EUR at a fixed rate and rejects every other currency."""
+
+    def __init__(self, rate=2.0, date='2019-06-01'):
+        self.rate = rate
+        self.date = date
+
+    def convert(self, amount, currency, new_currency):
+        if currency != 'EUR':
+            raise ValueError('{} is not a supported currency'.format(currency))
+        return amount * self.rate
+
+
+def test_overridden_accounts_are_converted_after_the_sign():
+    totals = aggregate_accounts(ACCOUNTS, 'USD', {2: 'EUR', 3: 'EUR'}, FakeConverter())
+    assert totals.categories['investment'].balance == 10001
+    assert totals.categories['credit'].balance == -500
+    assert totals.categories['bank'].balance == 1000.0
+
+
+def test_unknown_override_currency_leaves_the_balance():
+    totals = aggregate_accounts(ACCOUNTS, 'USD', {1: 'XXX'}, FakeConverter())
+    assert totals.categories['bank'].balance == 1000.0
+
+
+def test_excluded_accounts_are_left_out_everywhere():
+    totals = aggregate_accounts(ACCOUNTS, 'USD', {1: 'EUR'}, FakeConverter(), excluded_accounts=frozenset([1, 3]))
+    assert totals.categories['bank'].accounts == ()
+    assert totals.categories['credit'].balance == 0
+    assert totals.assets == 5000
+    assert totals.liabilities == -100000
+
+
+def test_unchanged_categories_are_reused():
+    previous = aggregate_accounts(ACCOUNTS, 'USD')
+    # Equal records from a new fetch, with one balance moved
+    accounts = [account._replace() for account in ACCOUNTS]
+    accounts[0] = accounts[0]._replace(currentBalance=1100.0)
+    totals = aggregate_accounts(accounts, 'USD', previous=previous)
+    assert totals.categories['investment'] is previous.categories['investment']
+    assert totals.categories['vehicle'] is previous.categories['vehicle']
+    assert totals.categories['bank'] is not previous.categories['bank']
+    assert totals.categories['bank'].balance == 1100.0
+
+
+def test_new_rates_recompute_every_category():
+    previous = aggregate_accounts(ACCOUNTS, 'USD', {2: 'EUR'}, FakeConverter())
+    totals = aggregate_accounts(ACCOUNTS, 'USD', {2: 'EUR'}, FakeConverter(3.0, '2019-06-02'), previous=previous)
+    assert totals.categories['bank'] is not previous.categories['bank']
+    assert totals.categories['investment'].balance == 15001
@@ -0,0 +1,74 @@
+"""Daily series and trend metrics over balance history columns; these need NumPy."""
+
+from array import array
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from custom_components.mint_finance.analytics import (  # noqa: E402
+    DAY, compute_trends, daily_series, trend_metrics)
+from custom_components.mint_finance.history import BalanceHistory  # noqa: E402
+
+
+def columns(rows):
+    return (array('d', [row[0] for row in rows]), array('q', [row[1] for row in rows]),
+            array('d', [row[2] for row in rows]))
+
+
+def test_daily_series_sums_accounts_and_fills_gaps():
+    rows = [
+        (0.5 * DAY, 1, 100.0),
+        (0.6 * DAY, 2, 50.0),
+        (0.7 * DAY, 1, 110.0),
+        # Nothing on day 1
+        (2.5 * DAY, 2, 40.0),
+    ]
+    days, values = daily_series(*columns(rows), until=3.5 * DAY)
+    assert list(days) == [0, 1, 2, 3]
+    assert list(values) == [160.0, 160.0, 150.0, 150.0]
+
+
+def test_daily_series_filters_accounts_and_shifts_days():
+    rows = [(0.9 * DAY, 1, 100.0), (0.95 * DAY, 2, 50.0), (1.5 * DAY, 1, 80.0)]
+    days, values = daily_series(*columns(rows), account_ids={1})
+    assert list(days) == [0, 1]
+    assert list(values) == [100.0, 80.0]
+    # Two hours ahead of UTC, the second row falls on day 1
+    days, values = daily_series(*columns(rows), utc_offset=2 * 60 * 60)
+    assert list(days) == [0, 1]
+    assert list(values) == [100.0, 130.0]
+
+
+def test_daily_series_of_nothing():
+    days, values = daily_series(*columns([]))
+    assert len(days) == 0 and len(values) == 0
+
+
+def test_trend_metrics():
+    import numpy
+    values = numpy.array([100.0] * 60 + [120.0, 90.0, 110.0])
+    metrics = trend_metrics(values)
+    assert metrics.day_change == 20.0
+    assert metrics.month_change == 10.0
+    assert metrics.max_drawdown == 25.0
+    assert metrics.average_30d == round((27 * 100.0 + 120.0 + 90.0 + 110.0) / 30, 2)
+
+
+def test_trend_metrics_without_enough_data():
+    import numpy
+    assert trend_metrics(numpy.array([])).day_change is None
+    metrics = trend_metrics(numpy.array([5.0]))
+    assert metrics.day_change is None
+    assert metrics.average_90d == 5.0
+    assert metrics.max_drawdown == 0.0
+
+
+def test_compute_trends_from_history(tmpdir):
+    history = BalanceHistory(str(tmpdir.join('history')))
+    history.append(0.5 * DAY, {1: 100.0, 2: 10.0})
+    history.append(1.5 * DAY, {1: 150.0, 2: 10.0})
+    trends = compute_trends(history, {'all': None, 'first': {1}, 'second': {2}}, 1.5 * DAY)
+    assert trends['all'].day_change == 50.0
+    assert trends['first'].day_change == 50.0
+    assert trends['second'].day_change == 0.0
@@ -0,0 +1,78 @@
+"""HttpBackend against FakeMintServer."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.mint_finance.backend import BackendError, HttpBackend
+from custom_components.mint_finance.fake import FakeMintServer, generate_accounts, generate_budgets
+
+TOKEN = 'secret'
+
+
+class FakeBrowserSession(object):
+    """Stands in for MintSession: hands out a logged in browser with TOKEN."""
+
+    def __init__(self, token=TOKEN):
+        self.token = token
+        self.acquire_count = 0
+        self.stats = {}
+
+    def acquire(self):
+        self.acquire_count += 1
+        driver = SimpleNamespace(
+            get_cookies=lambda: [{'name': 'session', 'value': 'abc', 'domain': '127.0.0.1', 'path': '/'}],
+            execute_script=lambda script: 'fake browser')
+        return SimpleNamespace(driver=driver, token=self.token)
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server():
+    with FakeMintServer(generate_accounts(5), token=TOKEN, budgets=generate_budgets()) as server:
+        yield server
+
+
+def test_get_accounts_logs_in_once(server):
+    backend = HttpBackend(FakeBrowserSession(), base_url=server.base_url)
+    assert len(backend.get_accounts()) == 5
+    assert len(backend.get_accounts()) == 5
+    assert backend.login_count == 1
+    assert backend.get_accounts()[0]['lastUpdatedInDate'] is not None
+
+
+def test_logs_in_again_after_invalidate(server):
+    backend = HttpBackend(FakeBrowserSession(), base_url=server.base_url)
+    backend.get_accounts()
+    backend.invalidate()
+    # The token goes into the form, so it must be read after the login
+    backend.initiate_account_refresh()
+    backend.invalidate()
+    assert len(backend.get_accounts()) == 5
+    assert backend.login_count == 3
+
+
+def test_rejected_token_invalidates(server):
+    backend = HttpBackend(FakeBrowserSession(token='expired'), base_url=server.base_url)
+    with pytest.raises(BackendError):
+        backend.get_accounts()
+    assert backend._token is None
+
+
+def test_server_failure_is_a_backend_error(server):
+    backend = HttpBackend(FakeBrowserSession(), base_url=server.base_url)
+    server.injector.fail_next()
+    with pytest.raises(BackendError):
+        backend.get_accounts()
+    assert len(backend.get_accounts()) == 5
+
+
+def test_get_budgets_names_categories(server):
+    backend = HttpBackend(FakeBrowserSession(), base_url=server.base_url)
+    budgets = backend.get_budgets()
+    assert sorted(budget['cat'] for budget in budgets) == sorted(budget['cat'] for budget in server.budgets)
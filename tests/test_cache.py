@@ -0,0 +1,50 @@
+"""SnapshotCache rows through a stand-in for Home Assistant's Store."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('homeassistant')
+
+from custom_components.mint_finance.cache import SnapshotCache  # noqa: E402
+from custom_components.mint_finance.fake import generate_accounts  # noqa: E402
+from custom_components.mint_finance.models import normalize_account  # noqa: E402
+
+
+class MemoryStore(object):
+    """Keeps what Store would write to .storage."""
+
+    def __init__(self, data=None):
+        self.data = data
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+
+def make_cache(data=None):
+    cache = SnapshotCache.__new__(SnapshotCache)
+    cache._store = MemoryStore(data)
+    return cache
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_round_trip():
+    accounts = tuple(normalize_account(account) for account in generate_accounts(5))
+    cache = make_cache()
+    run(cache.async_save(accounts, 1234.5))
+    assert run(cache.async_load()) == (accounts, 1234.5)
+
+
+def test_empty_or_other_fields_is_no_cache():
+    assert run(make_cache().async_load()) is None
+    assert run(make_cache({'fetched_at': 1.0, 'fields': ['id'], 'accounts': [[1]]}).async_load()) is None
@@ -0,0 +1,47 @@
+"""CurrencyRates conversions from its JSON cache."""
+
+import json
+import time
+
+import pytest
+
+from custom_components.mint_finance.currency import CurrencyRates
+
+
+def write_cache(path, loaded_at):
+    with open(path, 'w') as cache_file:
+        json.dump({'date': '2019-06-01', 'loaded_at': loaded_at,
+                   'rates': {'EUR': 1.0, 'USD': 1.25, 'GBP': 0.5}}, cache_file)
+
+
+def no_rebuild():
+    raise AssertionError('the cache is fresh')
+
+
+def test_fresh_cache_is_used_without_rebuilding(tmpdir):
+    path = str(tmpdir.join('rates.json'))
+    write_cache(path, time.time())
+    rates = CurrencyRates(path, download=False)
+    rates._rebuild = no_rebuild
+    rates.refresh_if_due()
+    assert rates.date == '2019-06-01'
+    assert rates.convert(125.0, 'USD', 'GBP') == 50.0
+    assert rates.convert(10.0, 'XXX', 'XXX') == 10.0
+    with pytest.raises(ValueError):
+        rates.convert(10.0, 'XXX', 'USD')
+
+
+def test_failed_rebuild_keeps_the_old_rates(tmpdir):
+    path = str(tmpdir.join('rates.json'))
+    write_cache(path, time.time() - 2 * 24 * 60 * 60)
+    rates = CurrencyRates(path, download=False)
+
+    def offline():
+        raise OSError('offline')
+
+    rates._rebuild = offline
+    rates.refresh_if_due()
+    assert rates.convert(1.0, 'EUR', 'USD') == 1.25
+    # Not retried until the interval has passed again
+    rates._rebuild = no_rebuild
+    rates.refresh_if_due()
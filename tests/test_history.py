@@ -0,0 +1,71 @@
+"""BalanceHistory round trips through its column files."""
+
+import os
+
+import pytest
+
+from custom_components.mint_finance.history import BalanceHistory
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('history'))
+    history = BalanceHistory(path)
+    assert history.append(1.0, {1: 10.0, 2: 20.0}) == 2
+    assert history.append(2.0, {1: 10.0, 2: 25.0}) == 1
+    # Account 2 went away: recorded once at zero
+    assert history.append(3.0, {1: 10.0}) == 1
+    assert history.append(4.0, {1: 10.0}) == 0
+
+    reloaded = BalanceHistory(path)
+    assert reloaded.query() == [(1.0, 1, 10.0), (1.0, 2, 20.0), (2.0, 2, 25.0), (3.0, 2, 0.0)]
+    assert reloaded.query(start=2.0, account_ids=[2]) == [(2.0, 2, 25.0), (3.0, 2, 0.0)]
+    assert reloaded.append(5.0, {1: 10.0}) == 0
+
+
+def test_truncated_column_is_cut_to_complete_rows(tmpdir):
+    path = str(tmpdir.join('history'))
+    history = BalanceHistory(path)
+    history.append(1.0, {1: 10.0})
+    history.append(2.0, {1: 11.0})
+    # A crash after the timestamps were written, halfway through the accounts
+    with open(os.path.join(path, 'timestamps.bin'), 'ab') as column:
+        column.write(b'\0' * 8)
+    with open(os.path.join(path, 'accounts.bin'), 'ab') as column:
+        column.write(b'\0' * 3)
+
+    reloaded = BalanceHistory(path)
+    assert reloaded.query() == [(1.0, 1, 10.0), (2.0, 1, 11.0)]
+    assert len(reloaded) == 2
+    assert os.path.getsize(os.path.join(path, 'timestamps.bin')) == 16
+    assert reloaded.append(3.0, {1: 11.0}) == 0
+    assert reloaded.append(3.0, {1: 12.0}) == 1
+    assert BalanceHistory(path).query(start=3.0) == [(3.0, 1, 12.0)]
+
+
+def test_query_limit(tmpdir):
+    history = BalanceHistory(str(tmpdir.join('history')))
+    for timestamp in range(10):
+        history.append(float(timestamp), {1: float(timestamp + 1)})
+    assert [row[0] for row in history.query(limit=3)] == [0.0, 1.0, 2.0]
+    assert [row[0] for row in history.query(start=8.0, limit=3)] == [8.0, 9.0]
+
+
+def test_failed_write_leaves_columns_even(tmpdir, monkeypatch):
+    path = str(tmpdir.join('history'))
+    history = BalanceHistory(path)
+    history.append(1.0, {1: 10.0})
+
+    def failing_open(file, mode='r', *args, **kwargs):
+        if file.endswith('balances.bin') and 'a' in mode:
+            raise OSError(28, 'No space left on device')
+        return open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr('custom_components.mint_finance.history.open', failing_open, raising=False)
+    with pytest.raises(OSError):
+        history.append(2.0, {1: 11.0})
+    assert (len(history.timestamps), len(history.accounts), len(history.balances)) == (1, 1, 1)
+    assert os.path.getsize(os.path.join(path, 'timestamps.bin')) == 8
+
+    monkeypatch.undo()
+    assert history.append(3.0, {1: 11.0}) == 1
+    assert BalanceHistory(path).query() == [(1.0, 1, 10.0), (3.0, 1, 11.0)]
@@ -0,0 +1,23 @@
+"""Account records and merging the accounts of several logins."""
+
+from custom_components.mint_finance.fake import generate_accounts
+from custom_components.mint_finance.models import (
+    account_from_row, account_to_row, merge_accounts, normalize_account)
+
+
+def test_row_round_trip():
+    account = normalize_account(generate_accounts(1)[0])
+    assert account_from_row(account_to_row(account)) == account
+
+
+def test_merge_drops_ids_an_earlier_login_returned():
+    first = [normalize_account(account) for account in generate_accounts(3, seed=0)]
+    second = [normalize_account(account) for account in generate_accounts(2, seed=1)]
+    merged = merge_accounts([first, first[1:] + second])
+    assert [account.id for account in merged] == [account.id for account in first + second]
+
+
+def test_merge_keeps_lookalike_accounts_with_other_ids():
+    account = normalize_account(generate_accounts(1)[0])
+    twin = account._replace(id=account.id + 1)
+    assert merge_accounts([[account], [twin]]) == (account, twin)
@@ -0,0 +1,82 @@
+"""RetryPolicy and CircuitBreaker, driven by FakeBackend's injected failures."""
+
+import pytest
+
+from custom_components.mint_finance.backend import BackendError
+from custom_components.mint_finance.fake import FakeBackend, generate_accounts
+from custom_components.mint_finance.retry import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, RetryPolicy)
+
+
+def no_sleep(seconds):
+    pass
+
+
+def test_retry_recovers_from_failures():
+    backend = FakeBackend(generate_accounts(3))
+    backend.injector.fail_next(2)
+    retries = []
+    policy = RetryPolicy(attempts=3)
+    accounts = policy.call(backend.get_accounts, retry_on=BackendError,
+                           on_retry=lambda exp, attempt: retries.append(attempt), sleep=no_sleep)
+    assert len(accounts) == 3
+    assert retries == [1, 2]
+    assert policy.retry_count == 2
+    assert backend.failure_count == 2
+
+
+def test_retry_gives_up_after_the_last_attempt():
+    backend = FakeBackend(generate_accounts(3))
+    backend.injector.fail_next(3)
+    with pytest.raises(BackendError):
+        RetryPolicy(attempts=3).call(backend.get_accounts, retry_on=BackendError, sleep=no_sleep)
+    assert backend.call_count == 3
+
+
+def test_retry_delay_is_bounded():
+    policy = RetryPolicy(backoff=5.0, max_backoff=20.0, jitter=0.0)
+    assert [policy.delay(attempt) for attempt in (1, 2, 3, 4)] == [5.0, 10.0, 20.0, 20.0]
+
+
+def test_circuit_opens_after_threshold_and_half_opens_after_timeout():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    backend = FakeBackend(generate_accounts(3))
+    backend.injector.fail_next(2)
+    for _ in range(2):
+        assert breaker.allow_request()
+        with pytest.raises(BackendError):
+            backend.get_accounts()
+        breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow_request()
+
+    breaker._opened_at -= 61
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request()
+    backend.get_accounts()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker._opened_at -= 61
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker._opened_at -= 61
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    # A trial whose outcome never came gives way after another reset timeout
+    breaker._trial_at -= 61
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.allow_request()
+    assert breaker.allow_request()
@@ -0,0 +1,42 @@
+"""RefreshScheduler intervals and institution refreshes."""
+
+from datetime import datetime, timedelta
+
+from custom_components.mint_finance.models import MintAccount
+from custom_components.mint_finance.scheduler import RefreshScheduler
+
+UPDATED = datetime(2019, 6, 1, 12, 0)
+
+
+def accounts(*updated):
+    return [MintAccount(index, 'Account', 'Bank', 'bank', 1.0, 'USD', when, True, False, False)
+            for index, when in enumerate(updated)]
+
+
+def test_interval_backs_off_until_mint_has_news():
+    scheduler = RefreshScheduler(60, 600, backoff_factor=2.0)
+    scheduler.record_snapshot(accounts(UPDATED, None))
+    assert scheduler.next_delay(0) == 60
+    delays = []
+    for _ in range(5):
+        scheduler.record_snapshot(accounts(UPDATED, None))
+        delays.append(scheduler.next_delay(0))
+    assert delays == [120, 240, 480, 600, 600]
+    scheduler.record_snapshot(accounts(UPDATED, UPDATED + timedelta(hours=1)))
+    assert scheduler.next_delay(0) == 60
+
+
+def test_institution_refresh_polls_quickly_for_the_window():
+    scheduler = RefreshScheduler(60, 600, institution_refresh_interval=3600, refresh_window=900)
+    assert scheduler.institution_refresh_due(0)
+    scheduler.record_institution_refresh(0)
+    assert not scheduler.institution_refresh_due(3599)
+    assert scheduler.institution_refresh_due(3600)
+    for _ in range(3):
+        scheduler.record_snapshot(accounts(UPDATED))
+    assert scheduler.next_delay(100) == 60
+    assert scheduler.next_delay(1000) == 240
+
+
+def test_no_institution_refresh_without_an_interval():
+    assert not RefreshScheduler(60, 600).institution_refresh_due(0)
@@ -0,0 +1,184 @@
+"""sensor.py: configuration helpers and MintClient; these need Home Assistant installed."""
+
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('homeassistant')
+
+from custom_components.mint_finance import sensor  # noqa: E402
+from custom_components.mint_finance.backend import BACKEND_FAKE  # noqa: E402
+from custom_components.mint_finance.history import BalanceHistory  # noqa: E402
+from custom_components.mint_finance.retry import STATE_CLOSED, STATE_OPEN  # noqa: E402
+
+
+def test_lone_login_keeps_session_path():
+    config = {sensor.CONF_USERNAME: 'me@example.com', sensor.CONF_PASSWORD: 'secret'}
+    assert sensor.configured_logins(config, 'session') == [
+        {sensor.CONF_USERNAME: 'me@example.com', sensor.CONF_PASSWORD: 'secret', sensor.CONF_SESSION_PATH: 'session'}]
+
+
+def test_several_logins_get_their_own_session_paths():
+    config = {
+        sensor.CONF_USERNAME: 'me@example.com',
+        sensor.CONF_PASSWORD: 'secret',
+        sensor.CONF_LOGINS: [
+            {sensor.CONF_USERNAME: 'partner@example.com', sensor.CONF_PASSWORD: 'other'},
+            {sensor.CONF_USERNAME: 'kid', sensor.CONF_PASSWORD: 'third', sensor.CONF_SESSION_PATH: 'kid-session'},
+        ],
+    }
+    logins = sensor.configured_logins(config, 'session')
+    assert [login[sensor.CONF_USERNAME] for login in logins] == ['me@example.com', 'partner@example.com', 'kid']
+    assert [login[sensor.CONF_SESSION_PATH] for login in logins] == [
+        'session-me_example_com', 'session-partner_example_com', 'kid-session']
+
+
+def test_logins_without_username():
+    config = {sensor.CONF_LOGINS: [{sensor.CONF_USERNAME: 'partner', sensor.CONF_PASSWORD: 'other'}]}
+    assert sensor.configured_logins(config, 'session') == [
+        {sensor.CONF_USERNAME: 'partner', sensor.CONF_PASSWORD: 'other', sensor.CONF_SESSION_PATH: 'session'}]
+
+
+def test_currency_overrides_by_account():
+    assert sensor.compile_currency_overrides([{'EUR': [1, 2]}, {'GBP': [3]}, {'EUR': [2]}]) == {
+        1: 'EUR', 2: 'EUR', 3: 'GBP'}
+    assert sensor.compile_currency_overrides(None) == {}
+    with pytest.raises(sensor.vol.Invalid):
+        sensor.compile_currency_overrides([{'EUR': [1]}, {'GBP': [1]}])
+
+
+class FailingHistory(BalanceHistory):
+    """A balance history on a full disk."""
+
+    def append(self, timestamp, balances):
+        raise OSError(28, 'No space left on device')
+
+
+def make_client(tmpdir, accounts=10, history=None, **options):
+    config = {
+        sensor.CONF_USERNAME: 'me',
+        sensor.CONF_PASSWORD: 'secret',
+        sensor.CONF_BACKEND: BACKEND_FAKE,
+        sensor.CONF_FAKE_ACCOUNTS: accounts,
+    }
+    config.update(options)
+    client = sensor.MintClient(config, str(tmpdir.join('session')), history=history)
+    client.retry_policy.backoff = 0
+    return client
+
+
+def test_history_failure_still_publishes(tmpdir):
+    client = make_client(tmpdir, history=FailingHistory(str(tmpdir.join('history'))))
+    snapshot = client.get_snapshot()
+    assert snapshot is not None
+    assert len(snapshot.accounts) == 10
+
+
+def test_trend_failure_keeps_previous_trends(tmpdir, monkeypatch):
+    client = make_client(tmpdir, history=BalanceHistory(str(tmpdir.join('history'))),
+                         **{sensor.CONF_TRENDS: ['day_change']})
+
+    def no_numpy(*args):
+        raise ImportError('No module named numpy')
+
+    monkeypatch.setattr(sensor, 'compute_trends', no_numpy)
+    snapshot = client.get_snapshot()
+    assert snapshot is not None
+    assert snapshot.trends is None
+    assert len(client.history) == 10
+
+
+def fail_login(client, index):
+    def get_accounts():
+        raise sensor.BackendError('Mint is down')
+
+    client.backends[index].get_accounts = get_accounts
+
+
+def test_failing_login_is_served_stale_until_max_age(tmpdir, monkeypatch):
+    client = make_client(tmpdir, **{
+        sensor.CONF_LOGINS: [{sensor.CONF_USERNAME: 'partner', sensor.CONF_PASSWORD: 'other'}],
+        sensor.CONF_LOGIN_MAX_AGE: timedelta(hours=1)})
+    now = [1000.0]
+    monkeypatch.setattr(sensor.time, 'time', lambda: now[0])
+    assert not client.get_snapshot().stale
+    partner_accounts = client._login_accounts[1]
+    assert client.state_stats[sensor.ATTR_FAILING_LOGINS] == 0
+
+    fail_login(client, 1)
+    now[0] += 30 * 60
+    snapshot = client.get_snapshot()
+    assert snapshot.stale
+    assert set(partner_accounts).issubset(snapshot.accounts)
+    assert client.state_stats[sensor.ATTR_FAILING_LOGINS] == 1
+
+    # Past login_max_age the old accounts no longer stand in
+    now[0] += 60 * 60
+    assert client.get_snapshot() is snapshot
+    assert client.stats[sensor.ATTR_CIRCUIT_FAILURES] == 1
+
+
+def test_refresh_running_at_close_is_not_rescheduled(tmpdir, monkeypatch):
+    client = make_client(tmpdir)
+    scheduled = []
+    monkeypatch.setattr(sensor, 'async_call_later', lambda hass, delay, action: scheduled.append(delay))
+
+    async def refresh_then_close(now=None):
+        # Home Assistant stops while the fetch is awaited
+        await client.async_close()
+
+    client.async_refresh = refresh_then_close
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(client._async_scheduled_refresh())
+    finally:
+        loop.close()
+    assert scheduled == []
+
+
+class FakeCache(object):
+    """Records SnapshotCache saves."""
+
+    def __init__(self):
+        self.saved = []
+
+    async def async_save(self, accounts, fetched_at):
+        self.saved.append(accounts)
+
+
+def test_cache_is_only_saved_when_accounts_change(tmpdir):
+    client = make_client(tmpdir)
+    client.cache = FakeCache()
+    client.backends[0].volatility = 0
+    loop = asyncio.new_event_loop()
+    client.hass = SimpleNamespace(loop=loop, async_create_task=loop.create_task)
+
+    def refresh():
+        # The next refresh fetches again
+        client._last_attempt = None
+        loop.run_until_complete(client.async_refresh())
+
+    try:
+        refresh()
+        refresh()
+        assert len(client.cache.saved) == 1
+        client.backends[0].volatility = 0.01
+        refresh()
+        assert len(client.cache.saved) == 2
+        assert client.cache.saved[-1] == client.snapshot.accounts
+    finally:
+        loop.close()
+
+
+def test_failed_institution_refresh_reports_to_the_circuit(tmpdir):
+    client = make_client(tmpdir, **{sensor.CONF_CIRCUIT_THRESHOLD: 1})
+    client.backends[0].injector.fail_next()
+    client.initiate_account_refresh()
+    assert client.circuit_breaker.state == STATE_OPEN
+    client.circuit_breaker._opened_at -= client.circuit_breaker.reset_timeout
+    client.initiate_account_refresh()
+    # The trial succeeded, so the fetch is not turned away
+    assert client.circuit_breaker.state == STATE_CLOSED
+    assert client.get_snapshot() is not None
@@ -0,0 +1,79 @@
+"""AccountStore membership and change reporting."""
+
+from types import SimpleNamespace
+
+from custom_components.mint_finance.store import AccountStore
+
+
+def row(account_id, balance=100.0):
+    return {'id': account_id, 'name': 'Account {}'.format(account_id), 'balance': balance}
+
+
+def categories(**rows_by_type):
+    return dict((account_type, SimpleNamespace(accounts=rows)) for account_type, rows in rows_by_type.items())
+
+
+def test_new_accounts_change_membership():
+    store = AccountStore()
+    changed, membership = store.update(categories(bank=[row(1), row(2)], credit=[row(3)]), False)
+    assert changed == {1, 2, 3}
+    assert membership
+    assert store.category_ids('bank') == {1, 2}
+    assert 3 in store
+
+
+def test_balance_change_only_reports_that_account():
+    store = AccountStore()
+    store.update(categories(bank=[row(1), row(2)]), False)
+    changed, membership = store.update(categories(bank=[row(1), row(2, 50.0)]), False)
+    assert changed == {2}
+    assert not membership
+    assert store.get(2)['balance'] == 50.0
+
+
+def test_unchanged_categories_are_skipped():
+    store = AccountStore()
+    store.update(categories(bank=[row(1)], credit=[row(2)]), False)
+    changed, _ = store.update(categories(bank=[row(1, 5.0)], credit=[row(2, 5.0)]), False, changed_types={'bank'})
+    assert changed == {1}
+    assert store.get(2)['balance'] == 100.0
+
+
+def test_closed_account_is_removed():
+    store = AccountStore()
+    store.update(categories(bank=[row(1), row(2)]), False)
+    changed, membership = store.update(categories(bank=[row(1)]), False)
+    assert changed == {2}
+    assert membership
+    assert 2 not in store
+
+
+def test_account_moving_category_stays():
+    store = AccountStore()
+    store.update(categories(bank=[row(1)], investment=[row(2)]), False)
+    changed, membership = store.update(categories(bank=[row(1), row(2)], investment=[row(3)]), False)
+    assert 2 in store
+    assert store.category_ids('bank') == {1, 2}
+    assert store.category_ids('investment') == {3}
+    # Its row did not change, only where it is listed
+    assert changed == {3}
+    assert membership
+
+
+def test_vanished_category_drops_its_rows():
+    store = AccountStore()
+    store.update(categories(bank=[row(1)], unclassified=[row(2)]), False)
+    changed, membership = store.update(categories(bank=[row(1)]), False, changed_types=set())
+    assert changed == {2}
+    assert membership
+    assert 2 not in store
+    assert store.category_ids('unclassified') == frozenset()
+
+
+def test_stale_flip_changes_every_row():
+    store = AccountStore()
+    store.update(categories(bank=[row(1), row(2)]), False)
+    changed, membership = store.update(categories(bank=[row(1), row(2)]), True, changed_types=set())
+    assert changed == {1, 2}
+    assert not membership
+    assert store.stale
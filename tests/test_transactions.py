@@ -0,0 +1,90 @@
+"""TransactionStore's monthly spending deltas and TransactionSync."""
+
+from datetime import date
+
+import pytest
+
+from custom_components.mint_finance.fake import FakeBackend
+from custom_components.mint_finance.transactions import TransactionStore, TransactionSync
+
+
+def transaction(transaction_id, day, spending, category='Groceries'):
+    # id, login, date, amount, category, merchant, account, pending, spending
+    return (transaction_id, 0, day, -spending, category, 'Corner Market', 'Bank 0', 0, spending)
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = TransactionStore(str(tmpdir.join('transactions.db')))
+    yield store
+    store.close()
+
+
+def test_new_transactions_add_up(store):
+    assert store.upsert([transaction(1, '2019-06-01', 10.0), transaction(2, '2019-06-02', 5.5),
+                         transaction(3, '2019-06-03', 7.0, 'Restaurants')]) == 3
+    assert store.month_spending('2019-06') == {'Groceries': 15.5, 'Restaurants': 7.0}
+
+
+def test_unchanged_rows_are_not_counted_twice(store):
+    store.upsert([transaction(1, '2019-06-01', 10.0)])
+    assert store.upsert([transaction(1, '2019-06-01', 10.0)]) == 0
+    assert store.month_spending('2019-06') == {'Groceries': 10.0}
+
+
+def test_changed_amount_applies_the_difference(store):
+    store.upsert([transaction(1, '2019-06-01', 10.0), transaction(2, '2019-06-02', 5.0)])
+    assert store.upsert([transaction(1, '2019-06-01', 12.5)]) == 1
+    assert store.month_spending('2019-06') == {'Groceries': 17.5}
+
+
+def test_recategorized_and_moved_transactions(store):
+    store.upsert([transaction(1, '2019-06-30', 10.0)])
+    store.upsert([transaction(1, '2019-06-30', 10.0, 'Restaurants')])
+    assert store.month_spending('2019-06') == {'Groceries': 0.0, 'Restaurants': 10.0}
+    # A pending transaction that posts in the next month
+    store.upsert([transaction(1, '2019-07-01', 10.0, 'Restaurants')])
+    assert store.month_spending('2019-06') == {'Groceries': 0.0, 'Restaurants': 0.0}
+    assert store.month_spending('2019-07') == {'Restaurants': 10.0}
+
+
+def test_query_newest_first_with_limit(store):
+    store.upsert([transaction(index, '2019-06-{:02d}'.format(index), 1.0) for index in range(1, 11)])
+    assert [row[0] for row in store.query(limit=3)] == [10, 9, 8]
+    assert [row[0] for row in store.query(start='2019-06-09')] == [10, 9]
+    assert store.query(category='Restaurants') == []
+
+
+def mint_transaction(transaction_id, day, spending, pending=False):
+    return {'id': transaction_id, 'date': day, 'amount': '${:.2f}'.format(spending), 'isDebit': True,
+            'category': 'Groceries', 'isSpending': True, 'isPending': pending}
+
+
+def test_pruned_transactions_leave_the_spending(store):
+    store.upsert([transaction(1, '2019-06-01', 10.0), transaction(2, '2019-06-02', 5.0),
+                  transaction(3, '2019-06-20', 7.0)])
+    assert store.prune(0, '2019-06-02', '2019-06-30', {3}, {'watermark_date:0': '2019-06-20'}) == 1
+    assert [row[0] for row in store.query()] == [3, 1]
+    assert store.month_spending('2019-06') == {'Groceries': 17.0}
+    assert store.get_meta('watermark_date:0') == '2019-06-20'
+    assert store.prune(1, '2019-06-01', '2019-06-30', set()) == 0
+
+
+def test_sync_drops_a_pending_transaction_that_posted(store):
+    today = date(2019, 6, 20)
+    backend = FakeBackend([], transactions=[
+        mint_transaction(3, '06/19/19', 7.0, pending=True),
+        mint_transaction(2, '06/10/19', 5.0),
+        mint_transaction(1, '05/01/19', 10.0)])
+    sync = TransactionSync(store)
+    assert sync.sync(0, backend, today) == 3
+    assert store.month_spending('2019-06') == {'Groceries': 12.0}
+
+    # Posted under a new id, and the pending one is gone from Mint
+    backend.transactions[0] = mint_transaction(4, '06/20/19', 7.5)
+    assert sync.sync(0, backend, today) == 2
+    assert [row[0] for row in store.query()] == [4, 2, 1]
+    assert store.month_spending('2019-06') == {'Groceries': 12.5}
+    assert store.get_meta('watermark_date:0') == '2019-06-20'
+    # Older than the lookback, so not covered by the incremental pages
+    assert store.month_spending('2019-05') == {'Groceries': 10.0}
@@ -0,0 +1,64 @@
+"""BrowserWatchdog limits, recycling and orphan reaping, on stand-in processes."""
+
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.mint_finance.watchdog import BrowserWatchdog, user_data_dir
+
+
+@pytest.fixture
+def sleeper():
+    """Start a process that sleeps, with extra command line arguments."""
+    processes = []
+
+    def start(*args):
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'] + list(args))
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+def session(pid, created_at=None):
+    return SimpleNamespace(driver_pid=pid, created_at=created_at or time.time(), close=lambda: None)
+
+
+def test_user_data_dir(tmpdir):
+    assert user_data_dir(['chrome', '--user-data-dir={}'.format(tmpdir)]) == str(tmpdir)
+    assert user_data_dir(['chrome', '--headless']) is None
+    assert user_data_dir(None) is None
+
+
+def test_old_browser_is_due_without_measuring():
+    watchdog = BrowserWatchdog(max_memory=0, max_age=60)
+    assert watchdog.check(session(1, created_at=100.0), now=100.0 + 61).startswith('running for')
+    assert watchdog.check(session(None)) is None
+
+
+def test_browser_over_the_memory_limit_is_killed(sleeper):
+    pytest.importorskip('psutil')
+    driver = sleeper()
+    watchdog = BrowserWatchdog(max_memory=1024)
+    assert watchdog.check(session(driver.pid)) is None
+    watchdog.max_rss = 1
+    # close() leaves the process running, so the watchdog kills it
+    watchdog.watch([session(driver.pid)])
+    assert driver.wait(timeout=10) is not None
+    assert watchdog.stats['browser_recycles'] == 1
+
+
+def test_orphans_on_our_session_directory_are_reaped(sleeper, tmpdir):
+    pytest.importorskip('psutil')
+    ours = sleeper('--user-data-dir={}'.format(tmpdir.join('session')))
+    other = sleeper('--user-data-dir={}'.format(tmpdir.join('other')))
+    watchdog = BrowserWatchdog()
+    assert watchdog.reap_orphans([str(tmpdir.join('session'))]) == 1
+    assert ours.wait(timeout=10) is not None
+    assert other.poll() is None
@@ -0,0 +1,30 @@
+"""The worker's per-login backends."""
+
+from custom_components.mint_finance.worker import WorkerServer, login_key
+
+SPEC = {'backend': 'fake', 'username': 'user', 'password': 'secret', 'session_path': 'session', 'seed': 0,
+        'fake_accounts': 3}
+
+
+def test_login_key_digest_covers_the_whole_spec():
+    key, digest = login_key(SPEC)
+    other_key, other_digest = login_key(dict(SPEC, password='changed'))
+    assert key == other_key
+    assert digest != other_digest
+    assert login_key(dict(SPEC)) == (key, digest)
+
+
+def test_same_spec_shares_one_login(tmpdir):
+    server = WorkerServer(str(tmpdir.join('worker.sock')))
+    assert server._login(SPEC) is server._login(dict(SPEC))
+
+
+def test_changed_spec_replaces_and_closes_the_login(tmpdir):
+    server = WorkerServer(str(tmpdir.join('worker.sock')))
+    login = server._login(SPEC)
+    closed = []
+    login.backend.close = lambda: closed.append(True)
+    replacement = server._login(dict(SPEC, fake_accounts=5))
+    assert replacement is not login
+    assert closed == [True]
+    assert len(replacement.call('get_accounts', {})['result']) == 5